@@ -172,9 +172,25 @@ write_caddy_config() {
 
   cat > "${tmp_caddy}" <<CADDY
 ${CADDY_SITE_DOMAIN} {
-    encode zstd gzip
     root * ${export_root_path}
-    file_server browse
+
+    # Serve compacted idle sessions (<session_id>.json.gz) at <session_id>.json.
+    @compacted {
+        not file
+        file {path}.gz
+    }
+    handle @compacted {
+        rewrite * {path}.gz
+        header Content-Encoding gzip
+        header Content-Type application/json
+        header Vary Accept-Encoding
+        file_server
+    }
+
+    handle {
+        encode zstd gzip
+        file_server browse
+    }
 }
 CADDY
 
@@ -0,0 +1,80 @@
+"""Content-addressed storage for large sidecar payloads."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from export_state import ensure_dir
+
+
+BLOB_REF_KEY = "$blob"
+KNOWN_BLOBS_LIMIT = 65536
+
+_known_blobs: OrderedDict[str, None] = OrderedDict()
+_known_blobs_lock = threading.Lock()
+
+
+def build_blob_path(blob_dir: str, digest: str) -> Path:
+    return Path(blob_dir) / digest[:2] / digest[2:4] / digest
+
+
+def _is_known_blob(path: Path) -> bool:
+    with _known_blobs_lock:
+        if str(path) in _known_blobs:
+            _known_blobs.move_to_end(str(path))
+            return True
+        return False
+
+
+def _remember_blob(path: Path) -> None:
+    """Record a blob file that is known to be complete on disk."""
+
+    with _known_blobs_lock:
+        _known_blobs[str(path)] = None
+        if len(_known_blobs) > KNOWN_BLOBS_LIMIT:
+            _known_blobs.popitem(last=False)
+
+
+def store_blob(blob_dir: str, data: bytes, content_type: str = "json") -> dict:
+    """Store ``data`` once under its sha256 and return a reference object.
+
+    ``content_type`` is ``"json"`` when the blob holds a JSON document and
+    ``"text"`` for plain UTF-8 text.
+    """
+
+    digest = hashlib.sha256(data).hexdigest()
+    path = build_blob_path(blob_dir, digest)
+    if not _is_known_blob(path):
+        # Concurrent writers of the same digest each write their own temp
+        # file; os.replace makes whichever lands last the (identical) blob.
+        if not path.exists():
+            ensure_dir(str(path.parent))
+            tmp_path = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        _remember_blob(path)
+    return {BLOB_REF_KEY: f"sha256:{digest}", "length": len(data), "contentType": content_type}
+
+
+def is_blob_ref(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get(BLOB_REF_KEY), str)
+
+
+def load_blob(blob_dir: str, ref: dict) -> bytes:
+    algorithm, _, digest = ref[BLOB_REF_KEY].partition(":")
+    if algorithm != "sha256" or not digest:
+        raise ValueError(f"unsupported blob reference {ref[BLOB_REF_KEY]!r}")
+    with open(build_blob_path(blob_dir, digest), "rb") as f:
+        return f.read()
@@ -0,0 +1,114 @@
+"""Gzip compaction of idle session files.
+
+``<name>.json`` is rewritten as ``<name>.json.gz``, a series of independent
+gzip members (so plain ``zcat`` still reads it), plus ``<name>.json.gz.frames``
+listing each member's compressed and uncompressed byte range. A compacted file
+is restored to plain JSONL before anything is appended to it again.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+from pathlib import Path
+
+import json_codec
+
+
+COMPRESSED_SUFFIX = ".gz"
+FRAME_INDEX_SUFFIX = ".frames"
+COMPACT_FRAME_BYTES = 1024 * 1024
+
+
+def build_compacted_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}{COMPRESSED_SUFFIX}")
+
+
+def build_frame_index_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}{COMPRESSED_SUFFIX}{FRAME_INDEX_SUFFIX}")
+
+
+def _build_tmp_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+
+def _finish_tmp(f, tmp_path: Path, path: Path) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(tmp_path, path)
+
+
+def _remove(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def compact_file(path: Path, frame_bytes: int = COMPACT_FRAME_BYTES) -> bool:
+    """Replace ``path`` by its gzip frames and frame index; False if it does not exist.
+
+    Frames end on line boundaries, so each one decompresses to whole records.
+    """
+
+    try:
+        src = open(path, "rb")
+    except FileNotFoundError:
+        return False
+    compacted_path = build_compacted_path(path)
+    tmp_path = _build_tmp_path(compacted_path)
+    frames: list[dict] = []
+    with src, open(tmp_path, "wb") as dst:
+        offset = 0
+        plain_offset = 0
+        while True:
+            plain = src.read(frame_bytes)
+            if not plain:
+                break
+            if not plain.endswith(b"\n"):
+                plain += src.readline()
+            member = gzip.compress(plain, mtime=0)
+            dst.write(member)
+            frames.append(
+                {
+                    "offset": offset,
+                    "length": len(member),
+                    "plainOffset": plain_offset,
+                    "plainLength": len(plain),
+                }
+            )
+            offset += len(member)
+            plain_offset += len(plain)
+
+        index = {"version": 1, "format": "gzip", "plainLength": plain_offset, "frames": frames}
+        index_path = build_frame_index_path(path)
+        index_tmp_path = _build_tmp_path(index_path)
+        with open(index_tmp_path, "wb") as f:
+            f.write(json_codec.dumps(index).encode("utf-8"))
+            _finish_tmp(f, index_tmp_path, index_path)
+        # The plain file stays authoritative until the compressed copy is complete.
+        _finish_tmp(dst, tmp_path, compacted_path)
+    path.unlink()
+    return True
+
+
+def restore_compacted_file(path: Path) -> bool:
+    """Turn ``<path>.gz`` back into plain ``path`` before it is appended to.
+
+    When both exist the plain file wins: it is only removed after the
+    compressed copy was fully written, so a leftover ``.gz`` is stale.
+    """
+
+    compacted_path = build_compacted_path(path)
+    if not compacted_path.exists():
+        return False
+    if not path.exists():
+        tmp_path = _build_tmp_path(path)
+        with gzip.open(compacted_path, "rb") as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COMPACT_FRAME_BYTES)
+            _finish_tmp(dst, tmp_path, path)
+    _remove(compacted_path)
+    _remove(build_frame_index_path(path))
+    return True
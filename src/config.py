@@ -27,7 +27,14 @@ def _build_default_path(export_root: str, *parts: str) -> str:
 
 def load_common_config() -> dict:
     export_root = _get_env("EXPORT_ROOT", "./export")
-    return {"export_root": export_root}
+    return {
+        "export_root": export_root,
+        "output_max_open_files": _get_int_env("OUTPUT_MAX_OPEN_FILES", 128),
+        "output_flush_bytes": _get_int_env("OUTPUT_FLUSH_BYTES", 8 * 1024 * 1024),
+        "output_fsync": _get_int_env("OUTPUT_FSYNC", 0) == 1,
+        "output_background": _get_int_env("OUTPUT_BACKGROUND", 0) == 1,
+        "output_queue_bytes": _get_int_env("OUTPUT_QUEUE_BYTES", 64 * 1024 * 1024),
+    }
 
 
 def load_redis_config() -> dict:
@@ -36,6 +43,14 @@ def load_redis_config() -> dict:
     if not redis_url:
         raise ValueError("REDIS_URL is required")
 
+    request_body_mode = _get_env("REQUEST_BODY_MODE", "full")
+    if request_body_mode not in ("full", "delta"):
+        raise ValueError("REQUEST_BODY_MODE must be full or delta")
+
+    output_layout = _get_env("OUTPUT_LAYOUT", "flat")
+    if output_layout not in ("flat", "hashed"):
+        raise ValueError("OUTPUT_LAYOUT must be flat or hashed")
+
     return {
         **common,
         "redis_url": redis_url,
@@ -48,11 +63,63 @@ def load_redis_config() -> dict:
             "REDIS_SIDECARS_DIR",
             _build_default_path(common["export_root"], "redis", "request_sidecars"),
         ),
+        "output_layout": output_layout,
+        "output_seq_index": _get_int_env("OUTPUT_SEQ_INDEX", 0) == 1,
+        "blob_dir": _get_env(
+            "BLOB_DIR",
+            _build_default_path(common["export_root"], "redis", "blobs"),
+        ),
+        "blob_min_bytes": _get_int_env("BLOB_MIN_BYTES", 0),
+        "request_body_mode": request_body_mode,
+        "request_body_keyframe_interval": max(
+            _get_int_env("REQUEST_BODY_KEYFRAME_INTERVAL", 20), 1
+        ),
+        "sidecar_dedupe_meta": _get_int_env("SIDECAR_DEDUPE_META", 0) == 1,
+        "sidecar_raw_json": _get_int_env("SIDECAR_RAW_JSON", 0) == 1,
         "state_path": _get_env(
             "STATE_PATH",
             _build_default_path(common["export_root"], "state", "redis_puller.json"),
         ),
         "missing_skip_seconds": _get_int_env("MISSING_SKIP_SECONDS", 300),
+        "state_backend": _get_env("STATE_BACKEND", "json"),
+        "checkpoint_interval": _get_int_env("STATE_CHECKPOINT_SECONDS", 60),
+        "state_gc_grace_seconds": _get_int_env("STATE_GC_GRACE_SECONDS", 0),
+        "state_archive_path": _get_env("STATE_ARCHIVE_PATH"),
+        "compact_idle_seconds": _get_int_env("COMPACT_IDLE_SECONDS", 0),
+        "compact_batch_size": _get_int_env("COMPACT_BATCH_SIZE", 100),
+        "compact_time_budget_ms": _get_int_env("COMPACT_TIME_BUDGET_MS", 200),
+        "session_batch_size": _get_int_env("SESSION_BATCH_SIZE", 500),
+        "fetch_max_seqs": _get_int_env("FETCH_MAX_SEQS", 100),
+        "fetch_max_bytes": _get_int_env("FETCH_MAX_BYTES", 64 * 1024 * 1024),
+        "concurrency": _get_int_env("PULLER_CONCURRENCY", 1),
+        "incremental_messages": _get_int_env("INCREMENTAL_MESSAGES", 0) == 1,
+        "keyspace_events": _get_int_env("KEYSPACE_EVENTS", 0) == 1,
+        "keyspace_debounce_ms": _get_int_env("KEYSPACE_DEBOUNCE_MS", 200),
+        "shard_count": max(_get_int_env("SHARD_COUNT", 1), 1),
+        "shard_index": _get_int_env("SHARD_INDEX", -1),
+    }
+
+
+def build_shard_config(config: dict, shard_index: int) -> dict:
+    """Return a copy of a Redis config owning one shard, with its own state file."""
+
+    shard_count = config["shard_count"]
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"SHARD_INDEX must be between 0 and {shard_count - 1}")
+
+    def shard_path(value: str | None) -> str | None:
+        if not value:
+            return value
+        path = Path(value)
+        return str(
+            path.with_name(f"{path.stem}.shard-{shard_index}-of-{shard_count}{path.suffix}")
+        )
+
+    return {
+        **config,
+        "shard_index": shard_index,
+        "state_path": shard_path(config["state_path"]),
+        "state_archive_path": shard_path(config["state_archive_path"]),
     }
 
 
@@ -76,6 +143,7 @@ def load_db_config() -> dict:
             "DB_STATE_PATH",
             _build_default_path(common["export_root"], "state", "db_exporter.json"),
         ),
+        "state_backend": _get_env("DB_STATE_BACKEND", "json"),
         "poll_interval": _get_int_env("DB_POLL_INTERVAL_SECONDS", 300),
         "batch_size": _get_int_env("DB_BATCH_SIZE", 500),
     }
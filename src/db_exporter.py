@@ -8,10 +8,12 @@ from datetime import datetime, timezone
 
 import psycopg
 from psycopg.rows import dict_row
+from psycopg.types.json import set_json_loads
 
+import json_codec
 from config import load_db_config
-from export_state import STATE_VERSION, load_state, save_state
-from output_writer import append_jsonl, build_daily_jsonl_path
+from export_state import STATE_VERSION, open_state_store
+from output_writer import JsonlWriter, build_daily_jsonl_path, open_jsonl_writer
 
 
 DEFAULT_STATE = {
@@ -80,6 +82,7 @@ def _export_table(
     ts_field: str,
     output_dir: str,
     batch_size: int,
+    writer: JsonlWriter,
 ) -> int:
     entry = _get_table_state(state, table_name)
     cursor_ts = _parse_cursor_ts(
@@ -117,7 +120,7 @@ def _export_table(
             exported += 1
 
         for path, records in grouped.items():
-            append_jsonl(path, records)
+            writer.append(path, records)
 
         cursor_ts = last_seen_ts
         cursor_id = last_seen_id
@@ -130,31 +133,51 @@ def _export_table(
     return exported
 
 
-def run_once(config: dict) -> dict[str, int]:
-    state = load_state(config["state_path"], DEFAULT_STATE)
+def run_once(config: dict, writer: JsonlWriter | None = None) -> dict[str, int]:
+    store = open_state_store(
+        config["state_path"], DEFAULT_STATE, config["state_backend"], config["output_fsync"]
+    )
     results = {"message_request": 0, "usage_ledger": 0}
+    owns_writer = writer is None
+    try:
+        state = store.load()
+        if owns_writer:
+            writer = open_jsonl_writer(config)
+
+        with psycopg.connect(
+            config["database_url"], autocommit=True, row_factory=dict_row
+        ) as conn:
+            set_json_loads(json_codec.loads, conn)
+            results["message_request"] = _export_table(
+                conn=conn,
+                state=state,
+                table_name="message_request",
+                sql_text=MESSAGE_REQUEST_SQL,
+                ts_field="updated_at",
+                output_dir=config["message_request_dir"],
+                batch_size=config["batch_size"],
+                writer=writer,
+            )
+            results["usage_ledger"] = _export_table(
+                conn=conn,
+                state=state,
+                table_name="usage_ledger",
+                sql_text=USAGE_LEDGER_SQL,
+                ts_field="created_at",
+                output_dir=config["usage_ledger_dir"],
+                batch_size=config["batch_size"],
+                writer=writer,
+            )
 
-    with psycopg.connect(config["database_url"], autocommit=True, row_factory=dict_row) as conn:
-        results["message_request"] = _export_table(
-            conn=conn,
-            state=state,
-            table_name="message_request",
-            sql_text=MESSAGE_REQUEST_SQL,
-            ts_field="updated_at",
-            output_dir=config["message_request_dir"],
-            batch_size=config["batch_size"],
-        )
-        results["usage_ledger"] = _export_table(
-            conn=conn,
-            state=state,
-            table_name="usage_ledger",
-            sql_text=USAGE_LEDGER_SQL,
-            ts_field="created_at",
-            output_dir=config["usage_ledger_dir"],
-            batch_size=config["batch_size"],
-        )
-
-    save_state(config["state_path"], state)
+        writer.flush()
+        store.mark_dirty("tables", results.keys())
+        store.save(state)
+    finally:
+        try:
+            if owns_writer and writer is not None:
+                writer.close()
+        finally:
+            store.close()
     return results
 
 
@@ -169,9 +192,13 @@ def main() -> None:
         run_once(config)
         return
 
-    while True:
-        run_once(config)
-        time.sleep(config["poll_interval"])
+    writer = open_jsonl_writer(config)
+    try:
+        while True:
+            run_once(config, writer)
+            time.sleep(config["poll_interval"])
+    finally:
+        writer.close()
 
 
 if __name__ == "__main__":
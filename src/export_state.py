@@ -3,12 +3,17 @@
 from __future__ import annotations
 
 import copy
-import json
 import os
+import sqlite3
+import time
 from pathlib import Path
 
+import json_codec
+
 
 STATE_VERSION = 1
+STATE_BACKENDS = ("json", "journal", "sqlite")
+JOURNAL_COMPACT_MIN_BYTES = 16 * 1024 * 1024
 
 
 def ensure_dir(path: str) -> None:
@@ -19,7 +24,7 @@ def load_state(path: str, default_state: dict) -> dict:
     initial = copy.deepcopy(default_state)
     try:
         with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+            data = json_codec.loads(f.read())
             if isinstance(data, dict) and data.get("version") == initial.get("version"):
                 return data
     except FileNotFoundError:
@@ -29,9 +34,307 @@ def load_state(path: str, default_state: dict) -> dict:
     return initial
 
 
-def save_state(path: str, state: dict) -> None:
+def save_state(path: str, state: dict, fsync: bool = False) -> None:
     ensure_dir(str(Path(path).parent))
     tmp_path = f"{path}.tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        f.write(json_codec.dumps(state))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
     os.replace(tmp_path, path)
+
+
+class JsonStateStore:
+    """Whole-file JSON state, rewritten on every save.
+
+    With ``fsync`` every save is forced to disk before it returns.
+    """
+
+    def __init__(self, path: str, default_state: dict, fsync: bool = False):
+        self.path = path
+        self.default_state = default_state
+        self.fsync = fsync
+        self._dirty: dict[str, set[str]] = {}
+
+    def load(self) -> dict:
+        return load_state(self.path, self.default_state)
+
+    def mark_dirty(self, section: str, keys) -> None:
+        """Record entries of ``state[section]`` changed (or removed) since the last save."""
+
+        self._dirty.setdefault(section, set()).update(keys)
+
+    def save(self, state: dict) -> None:
+        save_state(self.path, state, self.fsync)
+        self._dirty = {}
+
+    def close(self) -> None:
+        pass
+
+
+class JournalStateStore(JsonStateStore):
+    """JSON snapshot plus an append-only journal of dirty section entries.
+
+    Each save appends one line per dirty entry (``{"s", "k", "v"}`` or a
+    ``"d"`` tombstone when the key is gone). Replaying full entry values is
+    idempotent, so a crash between writing a new snapshot and truncating the
+    journal is harmless. A torn final line left by an interrupted append is
+    skipped on load and terminated before the next append. The journal is
+    folded into the snapshot once it outgrows both the snapshot and
+    ``compact_min_bytes``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        default_state: dict,
+        compact_min_bytes: int = JOURNAL_COMPACT_MIN_BYTES,
+        fsync: bool = False,
+    ):
+        super().__init__(path, default_state, fsync)
+        self.journal_path = f"{path}.journal"
+        self.compact_min_bytes = compact_min_bytes
+
+    def load(self) -> dict:
+        state = load_state(self.path, self.default_state)
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json_codec.loads(line)
+                    except Exception:
+                        # A torn final line from an interrupted append.
+                        continue
+                    _apply_journal_record(state, record)
+        except FileNotFoundError:
+            pass
+        return state
+
+    def save(self, state: dict) -> None:
+        if self._should_compact():
+            self.compact(state)
+            return
+
+        lines: list[str] = []
+        for section_name, keys in self._dirty.items():
+            section = state.get(section_name)
+            if not isinstance(section, dict):
+                section = {}
+            for key in sorted(keys):
+                if key in section:
+                    record = {"s": section_name, "k": key, "v": section[key]}
+                else:
+                    record = {"s": section_name, "k": key, "d": 1}
+                lines.append(json_codec.dumps(record))
+        if lines:
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            ensure_dir(str(Path(self.journal_path).parent))
+            with open(self.journal_path, "a+b") as f:
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # End the torn line so it does not swallow this
+                        # save's first record.
+                        data = b"\n" + data
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        self._dirty = {}
+
+    def compact(self, state: dict) -> None:
+        save_state(self.path, state, self.fsync)
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+        self._dirty = {}
+
+    def _should_compact(self) -> bool:
+        try:
+            journal_bytes = os.path.getsize(self.journal_path)
+        except OSError:
+            return not os.path.exists(self.path)
+        try:
+            snapshot_bytes = os.path.getsize(self.path)
+        except OSError:
+            snapshot_bytes = 0
+        return journal_bytes > max(snapshot_bytes, self.compact_min_bytes)
+
+
+def _apply_journal_record(state: dict, record) -> None:
+    if not isinstance(record, dict):
+        return
+    section_name = record.get("s")
+    key = record.get("k")
+    if not isinstance(section_name, str) or not isinstance(key, str):
+        return
+    section = state.get(section_name)
+    if not isinstance(section, dict):
+        section = {}
+        state[section_name] = section
+    if record.get("d"):
+        section.pop(key, None)
+    elif "v" in record:
+        section[key] = record["v"]
+
+
+class SqliteStateStore(JsonStateStore):
+    """One SQLite row per section entry, upserted in a single transaction per save.
+
+    Dict-valued top-level keys (``sessions``, ``tables``) are sections and
+    every other top-level value lives in ``state_meta``. ``cursor_seq`` is
+    copied into its own column so progress can be queried without JSON
+    functions. An existing JSON snapshot at ``path`` is imported on first use.
+    """
+
+    def __init__(self, path: str, default_state: dict, fsync: bool = False):
+        super().__init__(path, default_state, fsync)
+        self.db_path = str(Path(path).with_suffix(".sqlite3")) if path.endswith(".json") else path
+        ensure_dir(str(Path(self.db_path).parent))
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_entries (
+              section TEXT NOT NULL,
+              key TEXT NOT NULL,
+              value TEXT NOT NULL,
+              cursor_seq INTEGER,
+              updated_at REAL NOT NULL,
+              PRIMARY KEY (section, key)
+            )
+            """
+        )
+        self._conn.commit()
+        self._full_sync = False
+
+    def load(self) -> dict:
+        meta_rows = self._conn.execute("SELECT key, value FROM state_meta").fetchall()
+        if not meta_rows:
+            # Nothing stored yet: start from the JSON snapshot (or the default)
+            # and write every entry on the first save.
+            self._full_sync = True
+            return load_state(self.path, self.default_state)
+
+        state: dict = {key: json_codec.loads(value) for key, value in meta_rows}
+        if state.get("version") != self.default_state.get("version"):
+            self._full_sync = True
+            return copy.deepcopy(self.default_state)
+        for name, value in self.default_state.items():
+            if isinstance(value, dict):
+                state[name] = {}
+        for section_name, key, value in self._conn.execute(
+            "SELECT section, key, value FROM state_entries"
+        ):
+            state.setdefault(section_name, {})[key] = json_codec.loads(value)
+        return state
+
+    def save(self, state: dict) -> None:
+        now = time.time()
+        with self._conn:
+            if self._full_sync:
+                self._conn.execute("DELETE FROM state_meta")
+                self._conn.execute("DELETE FROM state_entries")
+                dirty = {
+                    name: set(section)
+                    for name, section in state.items()
+                    if isinstance(section, dict)
+                }
+            else:
+                dirty = self._dirty
+            self._conn.executemany(
+                "INSERT INTO state_meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                [
+                    (name, json_codec.dumps(value))
+                    for name, value in state.items()
+                    if not isinstance(value, dict)
+                ],
+            )
+            upserts = []
+            deletes = []
+            for section_name, keys in dirty.items():
+                section = state.get(section_name)
+                if not isinstance(section, dict):
+                    section = {}
+                for key in keys:
+                    if key not in section:
+                        deletes.append((section_name, key))
+                        continue
+                    value = section[key]
+                    cursor_seq = value.get("cursor_seq") if isinstance(value, dict) else None
+                    upserts.append(
+                        (
+                            section_name,
+                            key,
+                            json_codec.dumps(value),
+                            cursor_seq if isinstance(cursor_seq, int) else None,
+                            now,
+                        )
+                    )
+            self._conn.executemany(
+                "INSERT INTO state_entries (section, key, value, cursor_seq, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(section, key) DO UPDATE SET value = excluded.value, "
+                "cursor_seq = excluded.cursor_seq, updated_at = excluded.updated_at",
+                upserts,
+            )
+            self._conn.executemany(
+                "DELETE FROM state_entries WHERE section = ? AND key = ?", deletes
+            )
+        self._full_sync = False
+        self._dirty = {}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def state_store_modified_at(path: str, backend: str = "json") -> float | None:
+    """Return when ``backend`` last wrote state for ``path``, or ``None`` if it never did."""
+
+    if backend == "sqlite":
+        db_path = str(Path(path).with_suffix(".sqlite3")) if path.endswith(".json") else path
+        candidates = [db_path, f"{db_path}-wal", path]
+    elif backend == "journal":
+        candidates = [path, f"{path}.journal"]
+    else:
+        candidates = [path]
+    modified = None
+    for candidate in candidates:
+        try:
+            mtime = os.path.getmtime(candidate)
+        except OSError:
+            continue
+        modified = mtime if modified is None else max(modified, mtime)
+    return modified
+
+
+def read_state(path: str, default_state: dict, backend: str = "json") -> dict:
+    """Load state written by ``backend`` at ``path`` without creating any files."""
+
+    if backend == "sqlite":
+        db_path = str(Path(path).with_suffix(".sqlite3")) if path.endswith(".json") else path
+        if not os.path.exists(db_path):
+            # The store would import this JSON snapshot on first use.
+            return load_state(path, default_state)
+    store = open_state_store(path, default_state, backend)
+    try:
+        return store.load()
+    finally:
+        store.close()
+
+
+def open_state_store(
+    path: str, default_state: dict, backend: str = "json", fsync: bool = False
+) -> JsonStateStore:
+    if backend == "json":
+        return JsonStateStore(path, default_state, fsync)
+    if backend == "journal":
+        return JournalStateStore(path, default_state, fsync=fsync)
+    if backend == "sqlite":
+        return SqliteStateStore(path, default_state, fsync)
+    raise ValueError(f"unknown state backend {backend!r}; expected one of {STATE_BACKENDS}")
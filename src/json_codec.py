@@ -0,0 +1,213 @@
+"""JSON encoding and decoding shared by the exporters.
+
+Uses orjson when it is installed and the standard library ``json`` otherwise.
+Both backends produce the same text: compact separators, no ASCII escaping,
+``Decimal``/``datetime``/``date``/``bytes`` encoded the way
+``normalize_json_value`` does. orjson output that could differ from ``json``
+(exponent floats, integers beyond 64 bits, non-string keys...) is re-encoded
+with the standard library.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# Candidate scans run on a copy with every digit mapped to "0" so plain
+# bytes.find does the searching; each hit is then checked to be a number token
+# (preceded by a JSON delimiter) rather than part of a string.
+_DIGITS_AS_ZERO = bytes.maketrans(b"123456789", b"000000000")
+_NUMBER_DELIMITERS = b":,[ \t\r\n"
+_LONG_INTEGER_DIGITS = 19
+
+
+def _starts_number_token(data: bytes, index: int) -> bool:
+    if index > 0 and data[index - 1] == 0x2D:  # "-"
+        index -= 1
+    return index == 0 or data[index - 1] in _NUMBER_DELIMITERS
+
+
+def _has_exponent_float(data: bytes) -> bool:
+    # orjson writes 1e16 / 0.00001 where json writes 1e+16 / 1e-05.
+    index = data.find(b"0.0000")
+    while index >= 0:
+        if _starts_number_token(data, index):
+            return True
+        index = data.find(b"0.0000", index + 1)
+    if b"e" not in data:
+        return False
+    digits = data.translate(_DIGITS_AS_ZERO)
+    index = digits.find(b"0e")
+    while index >= 0:
+        start = index
+        while start > 0 and digits[start - 1] in b"0.":
+            start -= 1
+        if _starts_number_token(data, start):
+            return True
+        index = digits.find(b"0e", index + 2)
+    return False
+
+
+def _has_long_integer(data: bytes) -> bool:
+    # orjson decodes integers beyond 64 bits as floats; json keeps them exact.
+    digits = data.translate(_DIGITS_AS_ZERO)
+    run = b"0" * _LONG_INTEGER_DIGITS
+    index = digits.find(run)
+    while index >= 0:
+        start = index
+        while start > 0 and digits[start - 1] == 0x30:
+            start -= 1
+        if _starts_number_token(data, start):
+            return True
+        end = index + _LONG_INTEGER_DIGITS
+        while end < len(digits) and digits[end] == 0x30:
+            end += 1
+        index = digits.find(run, end)
+    return False
+
+
+def _encode_native(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.isoformat() + "Z"
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except Exception:
+            return value.hex()
+    return None
+
+
+def _build_default(default):
+    def encode_default(value):
+        if isinstance(value, (Decimal, date, bytes)):
+            return _encode_native(value)
+        if default is not None:
+            return default(value)
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    return encode_default
+
+
+def _normalize_fallback(value):
+    # Slow path for values json.dumps rejects as-is: non-string keys it cannot
+    # coerce, and non-finite floats (orjson writes those as null).
+    if isinstance(value, dict):
+        return {str(k): _normalize_fallback(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_fallback(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (Decimal, date, bytes)):
+        return _encode_native(value)
+    return value
+
+
+def _dumps_stdlib(value, sort_keys: bool, encode_default) -> str:
+    try:
+        return json.dumps(
+            value,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=sort_keys,
+            allow_nan=False,
+            default=encode_default,
+        )
+    except (TypeError, ValueError):
+        return json.dumps(
+            _normalize_fallback(value),
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=sort_keys,
+            allow_nan=False,
+            default=encode_default,
+        )
+
+
+def _dumps_orjson(value, sort_keys: bool, encode_default, match_json: bool = True) -> bytes | None:
+    if orjson is None:
+        return None
+    option = orjson.OPT_PASSTHROUGH_DATETIME
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    try:
+        data = orjson.dumps(value, default=encode_default, option=option)
+    except orjson.JSONEncodeError:
+        return None
+    if match_json and _has_exponent_float(data):
+        return None
+    return data
+
+
+def dumps(value, sort_keys: bool = False, default=None) -> str:
+    """Encode ``value`` as compact JSON text.
+
+    ``default`` is called for objects neither backend can encode natively,
+    like ``json.dumps(default=...)``. It may be called more than once for the
+    same object when orjson output has to be re-encoded.
+    """
+
+    encode_default = _build_default(default)
+    data = _dumps_orjson(value, sort_keys, encode_default)
+    if data is not None:
+        return data.decode("utf-8")
+    return _dumps_stdlib(value, sort_keys, encode_default)
+
+
+def dumps_bytes(value, sort_keys: bool = False, default=None, match_json: bool = True) -> bytes:
+    """``dumps`` encoded as UTF-8, without a round trip through ``str`` on orjson.
+
+    With ``match_json=False`` orjson output is returned as is, skipping the
+    scan for floats it spells differently from ``json`` (``1e16``/``1e+16``).
+    The bytes are then only reproducible with the same backend, which is
+    enough for hashing.
+    """
+
+    encode_default = _build_default(default)
+    data = _dumps_orjson(value, sort_keys, encode_default, match_json)
+    if data is not None:
+        return data
+    return _dumps_stdlib(value, sort_keys, encode_default).encode("utf-8")
+
+
+def _reject_constant(name):
+    raise ValueError(f"{name} is not valid JSON")
+
+
+def loads(data, allow_nan: bool = True):
+    """Decode JSON from ``str`` or ``bytes``; raises ``ValueError`` on bad input.
+
+    ``NaN``/``Infinity`` are accepted like ``json.loads`` does unless
+    ``allow_nan`` is false (orjson never accepts them).
+    """
+
+    if orjson is not None:
+        raw = data
+        if isinstance(raw, str):
+            try:
+                raw = raw.encode("utf-8")
+            except UnicodeEncodeError:
+                raw = None
+        if raw is not None and not _has_long_integer(raw):
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                # NaN/Infinity, lone surrogates, deep nesting...: let json decide.
+                pass
+    if allow_nan:
+        return json.loads(data)
+    return json.loads(data, parse_constant=_reject_constant)
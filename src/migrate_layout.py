@@ -0,0 +1,93 @@
+"""Usage: python3 src/migrate_layout.py --layout {flat,hashed} DIR [DIR ...]
+
+Moves the session files of DEST_DIR / REDIS_SIDECARS_DIR between the flat and
+hashed layouts and records the new layout in DIR/.layout.json. Stop the puller
+before running it; an interrupted run can simply be repeated.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+from pathlib import Path
+
+from compactor import COMPRESSED_SUFFIX, FRAME_INDEX_SUFFIX
+from export_state import ensure_dir
+from output_writer import (
+    HASHED_LAYOUT,
+    OUTPUT_LAYOUTS,
+    SEQ_INDEX_SUFFIX,
+    build_layout_relative_path,
+    write_output_layout,
+)
+
+
+# "<safe_id>.json" and the files derived from it: ".json.idx", ".json.gz" and
+# ".json.gz.frames". The id is greedy, so ids that contain ".json." themselves
+# keep it.
+SESSION_FILE_RE = re.compile(
+    r"^(?P<safe_id>.+)(?P<suffix>\.json(?:%s|%s(?:%s)?)?)$"
+    % (
+        re.escape(SEQ_INDEX_SUFFIX),
+        re.escape(COMPRESSED_SUFFIX),
+        re.escape(FRAME_INDEX_SUFFIX),
+    )
+)
+
+
+def _iter_session_files(base_dir: Path):
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if name.startswith(".") or name.endswith(".tmp"):
+                continue
+            match = SESSION_FILE_RE.match(name)
+            if match:
+                yield Path(root) / name, match.group("safe_id"), match.group("suffix")
+
+
+def _remove_empty_dirs(base_dir: Path) -> None:
+    for root, _, _ in os.walk(base_dir, topdown=False):
+        path = Path(root)
+        if path != base_dir and not path.name.startswith("."):
+            try:
+                path.rmdir()
+            except OSError:
+                # Not empty.
+                pass
+
+
+def migrate_layout(base_dir: str, layout_name: str) -> int:
+    """Move every session file under ``base_dir`` to ``layout_name``; return the count moved."""
+
+    base = Path(base_dir)
+    layout = dict(HASHED_LAYOUT) if layout_name == "hashed" else {"layout": "flat"}
+    moved = 0
+    for path, safe_id, suffix in list(_iter_session_files(base)):
+        target = base / build_layout_relative_path(layout, safe_id, suffix)
+        if target == path:
+            continue
+        if target.exists():
+            raise FileExistsError(f"{target} already exists; not overwriting it with {path}")
+        ensure_dir(str(target.parent))
+        os.replace(path, target)
+        moved += 1
+    write_output_layout(base_dir, layout_name)
+    _remove_empty_dirs(base)
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layout", choices=OUTPUT_LAYOUTS, required=True)
+    parser.add_argument("dirs", nargs="+", help="DEST_DIR and/or REDIS_SIDECARS_DIR")
+    args = parser.parse_args()
+
+    for base_dir in args.dirs:
+        moved = migrate_layout(base_dir, args.layout)
+        print(f"{base_dir}: moved {moved} files to the {args.layout} layout")
+
+
+if __name__ == "__main__":
+    main()
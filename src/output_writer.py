@@ -2,15 +2,110 @@
 
 from __future__ import annotations
 
-import json
+import hashlib
+import logging
+import os
+import secrets
+import threading
+from collections import OrderedDict
 from datetime import date, datetime
 from decimal import Decimal
 from pathlib import Path
 
+import json_codec
+from compactor import restore_compacted_file
 from export_state import ensure_dir
 from session_events import sanitize_path_segment
 
 
+OUTPUT_LAYOUTS = ("flat", "hashed")
+SEQ_INDEX_SUFFIX = ".idx"
+LAYOUT_FILE_NAME = ".layout.json"
+HASHED_LAYOUT = {"version": 1, "layout": "hashed", "hash": "sha256", "levels": 2, "width": 2}
+
+_output_layouts: dict[str, dict] = {}
+logger = logging.getLogger(__name__)
+
+
+class RawJSON:
+    """JSON text that ``append_jsonl`` embeds verbatim instead of re-encoding.
+
+    Build it with ``as_raw_json`` so the text is known to be a single valid
+    JSON container on one line.
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+_JSON_WHITESPACE = " \t\r\n"
+
+
+def as_raw_json(value, require_object: bool = False) -> RawJSON | None:
+    """Wrap a Redis value as RawJSON once it parses as a single JSON document.
+
+    Returns None when the value is not a JSON object (or array, unless
+    ``require_object``) so callers can fall back to ``json.loads``. Parsing
+    only validates; the text is still embedded as-is rather than re-encoded.
+    ``NaN``/``Infinity`` are rejected too: the codec writes them as ``null``
+    and embedding them verbatim would not be valid JSON. Raw CR/LF can only
+    be insignificant whitespace in valid JSON, so they are folded to spaces to
+    keep one record per line.
+    """
+
+    if isinstance(value, bytes):
+        whitespace = _JSON_WHITESPACE.encode("ascii")
+    elif isinstance(value, str):
+        whitespace = _JSON_WHITESPACE
+    else:
+        return None
+    # Locate the envelope in place; the value can be megabytes.
+    start, end = 0, len(value)
+    while start < end and value[start] in whitespace:
+        start += 1
+    while end > start and value[end - 1] in whitespace:
+        end -= 1
+    if end - start < 2:
+        return None
+    envelope = value[start : start + 1] + value[end - 1 : end]
+    if isinstance(envelope, bytes):
+        envelope = envelope.decode("latin-1")
+    if envelope != "{}" and (require_object or envelope != "[]"):
+        return None
+    try:
+        json_codec.loads(value, allow_nan=False)
+        text = value.decode("utf-8") if isinstance(value, bytes) else value
+    except Exception:
+        return None
+    if start or end < len(value):
+        text = text.strip(_JSON_WHITESPACE)
+    if "\n" in text or "\r" in text:
+        text = text.replace("\r", " ").replace("\n", " ")
+    return RawJSON(text)
+
+
+def encode_jsonl_record(record) -> str:
+    raw_texts: dict[int, tuple[int, str]] = {}
+    marker = f"\x00raw-json-{secrets.token_hex(8)}-"
+
+    def embed_raw(value):
+        if isinstance(value, RawJSON):
+            # Keyed by identity: the codec may encode the record twice.
+            index, _ = raw_texts.setdefault(id(value), (len(raw_texts), value.text))
+            return f"{marker}{index}\x00"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    line = json_codec.dumps(record, default=embed_raw)
+    if raw_texts:
+        # Markers are encoded as quoted JSON strings with escaped NULs.
+        encoded_marker = json_codec.dumps(marker)[:-1]
+        for index, text in raw_texts.values():
+            line = line.replace(f"{encoded_marker}{index}\\u0000\"", text)
+    return line
+
+
 def normalize_json_value(value):
     if isinstance(value, dict):
         return {str(k): normalize_json_value(v) for k, v in value.items()}
@@ -34,25 +129,415 @@ def normalize_json_value(value):
     return value
 
 
-def append_jsonl(path: Path, records: list[dict]) -> None:
+def append_jsonl(path: Path, records: list[dict], index_sequences: bool = False) -> None:
     if not records:
         return
-    ensure_dir(str(path.parent))
-    with open(path, "a", encoding="utf-8") as f:
-        for record in records:
-            f.write(
-                json.dumps(
-                    normalize_json_value(record),
-                    ensure_ascii=False,
-                    separators=(",", ":"),
-                )
-            )
-            f.write("\n")
+    writer = JsonlWriter(max_open_files=2, flush_bytes=0, index_sequences=index_sequences)
+    try:
+        writer.append(path, records)
+    finally:
+        writer.close()
+
+
+def build_seq_index_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}{SEQ_INDEX_SUFFIX}")
+
+
+def read_seq_index(path: Path) -> list[tuple[int, int, int]]:
+    """Return the ``(requestSequence, offset, length)`` entries indexed for ``path``.
+
+    A sequence exported again after a restart has several entries; the last
+    one is the newest copy. Offsets refer to the plain JSONL file.
+    """
+
+    entries: list[tuple[int, int, int]] = []
+    try:
+        with open(build_seq_index_path(path), "rb") as f:
+            for line in f:
+                try:
+                    seq, offset, length = json_codec.loads(line)
+                except Exception:
+                    # A torn final line from an interrupted append.
+                    continue
+                entries.append((seq, offset, length))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_indexed_records(path: Path, seq: int) -> list[dict]:
+    """Read the records of one ``requestSequence`` by seeking through the index."""
+
+    ranges = [
+        (offset, length)
+        for entry_seq, offset, length in read_seq_index(path)
+        if entry_seq == seq
+    ]
+    if not ranges:
+        return []
+    offset, length = ranges[-1]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    return [json_codec.loads(line) for line in data.splitlines() if line]
+
+
+class _PendingFile:
+    """Encoded records waiting to be appended to one file."""
+
+    __slots__ = ("chunks", "size", "spans")
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.size = 0
+        # (requestSequence, offset within this buffer, length)
+        self.spans: list[tuple[int, int, int]] = []
+
+    def add(self, chunk: bytes, spans) -> None:
+        for seq, offset, length in spans:
+            offset += self.size
+            if self.spans:
+                last_seq, last_offset, last_length = self.spans[-1]
+                if last_seq == seq and last_offset + last_length == offset:
+                    self.spans[-1] = (seq, last_offset, last_length + length)
+                    continue
+            self.spans.append((seq, offset, length))
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+
+
+def _encode_chunk(records: list[dict], index_sequences: bool) -> tuple[bytes, list]:
+    lines = [f"{encode_jsonl_record(record)}\n".encode("utf-8") for record in records]
+    spans: list[tuple[int, int, int]] = []
+    if index_sequences:
+        offset = 0
+        for record, line in zip(records, lines):
+            seq = record.get("requestSequence") if isinstance(record, dict) else None
+            if isinstance(seq, int) and not isinstance(seq, bool):
+                if spans and spans[-1][0] == seq and spans[-1][1] + spans[-1][2] == offset:
+                    spans[-1] = (seq, spans[-1][1], spans[-1][2] + len(line))
+                else:
+                    spans.append((seq, offset, len(line)))
+            offset += len(line)
+    return b"".join(lines), spans
+
+
+class JsonlWriter:
+    """Buffered JSONL appends through a bounded cache of open file handles.
+
+    ``append`` encodes records and buffers them per file; each file's buffer
+    is later written with a single call. Without a background thread, buffers
+    are written by ``flush`` or once ``flush_bytes`` are pending. With
+    ``background=True`` a writer thread group-commits whatever has been
+    buffered while it was busy, appenders block once ``queue_bytes`` are
+    pending, and ``flush`` waits until everything appended so far is on disk.
+    Callers flush before saving state that points past the appended records.
+    With ``index_sequences`` every file gets a ``.idx`` companion listing the
+    byte range of each ``requestSequence`` (see ``read_seq_index``). Safe to
+    share between threads.
+    """
+
+    def __init__(
+        self,
+        max_open_files: int = 128,
+        flush_bytes: int = 8 * 1024 * 1024,
+        fsync: bool = False,
+        background: bool = False,
+        queue_bytes: int = 64 * 1024 * 1024,
+        index_sequences: bool = False,
+    ):
+        self.max_open_files = max(max_open_files, 1)
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+        self.queue_bytes = queue_bytes
+        self.index_sequences = index_sequences
+        # _cond guards the buffers and tickets; _io_lock guards handles and
+        # writing, so appends never wait on disk I/O except for backpressure.
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._buffers: dict[Path, _PendingFile] = {}
+        self._pending_bytes = 0
+        self._appended_ticket = 0
+        self._durable_ticket = 0
+        self._error: BaseException | None = None
+        self._closing = False
+        self._handles: OrderedDict[Path, object] = OrderedDict()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+            self._thread.start()
+
+    @property
+    def durable_ticket(self) -> int:
+        """Ticket of the last ``append`` known to be written (and fsynced if enabled)."""
+
+        with self._cond:
+            return self._durable_ticket
+
+    def append(self, path: Path, records: list[dict]) -> int:
+        """Buffer records for ``path`` and return their ticket."""
+
+        if not records:
+            with self._cond:
+                return self._appended_ticket
+        chunk, spans = _encode_chunk(records, self.index_sequences)
+        flush_now = False
+        with self._cond:
+            self._raise_error()
+            if self._thread is not None:
+                while self._pending_bytes and self._pending_bytes + len(chunk) > self.queue_bytes:
+                    self._cond.wait()
+                    self._raise_error()
+            pending_file = self._buffers.get(Path(path))
+            if pending_file is None:
+                pending_file = self._buffers[Path(path)] = _PendingFile()
+            pending_file.add(chunk, spans)
+            self._pending_bytes += len(chunk)
+            self._appended_ticket += 1
+            ticket = self._appended_ticket
+            if self._thread is not None:
+                self._cond.notify_all()
+            elif self.flush_bytes > 0 and self._pending_bytes >= self.flush_bytes:
+                flush_now = True
+        if flush_now:
+            self._write_pending()
+        return ticket
+
+    def flush(self, wait: bool = True) -> None:
+        """Write buffered records; in background mode, optionally wait for them."""
+
+        if self._thread is None:
+            self._write_pending()
+            return
+        with self._cond:
+            target = self._appended_ticket
+            while self._durable_ticket < target:
+                self._raise_error()
+                if not wait:
+                    return
+                self._cond.wait()
+
+    def close_file(self, path: Path) -> None:
+        """Flush and close one cached handle, e.g. before the file is moved.
+
+        Only waits for other files' records when ``path`` has some buffered.
+        """
+
+        with self._cond:
+            buffered = Path(path) in self._buffers
+        if buffered:
+            self.flush()
+        with self._io_lock:
+            handle = self._handles.pop(Path(path), None)
+            if handle is not None:
+                handle.close()
+
+    def close(self) -> None:
+        try:
+            if self._thread is not None:
+                with self._cond:
+                    self._closing = True
+                    self._cond.notify_all()
+                self._thread.join()
+                self._thread = None
+                with self._cond:
+                    self._raise_error()
+            self._write_pending()
+        finally:
+            with self._io_lock:
+                while self._handles:
+                    _, handle = self._handles.popitem(last=False)
+                    handle.close()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("JSONL writer thread failed") from self._error
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buffers and not self._closing:
+                    self._cond.wait()
+                if not self._buffers:
+                    return
+            try:
+                self._write_pending()
+            except BaseException as exc:
+                with self._cond:
+                    self._error = exc
+                    self._cond.notify_all()
+                return
+
+    def _write_pending(self) -> None:
+        with self._io_lock:
+            with self._cond:
+                pending = self._buffers
+                ticket = self._appended_ticket
+                self._buffers = {}
+            written_bytes = 0
+            try:
+                while pending:
+                    path, pending_file = next(iter(pending.items()))
+                    self._write_file(path, pending_file)
+                    del pending[path]
+                    written_bytes += pending_file.size
+            finally:
+                with self._cond:
+                    if pending:
+                        # Keep unwritten buffers, ahead of newer appends, for a
+                        # retry (which may duplicate a partial write).
+                        for path, newer in self._buffers.items():
+                            merged = pending.get(path)
+                            if merged is None:
+                                pending[path] = newer
+                                continue
+                            base = merged.size
+                            merged.chunks.extend(newer.chunks)
+                            merged.size += newer.size
+                            merged.spans.extend(
+                                (seq, base + offset, length) for seq, offset, length in newer.spans
+                            )
+                        self._buffers = pending
+                    else:
+                        self._durable_ticket = max(self._durable_ticket, ticket)
+                    self._pending_bytes -= written_bytes
+                    self._cond.notify_all()
+
+    def _write_file(self, path: Path, pending_file: _PendingFile) -> None:
+        base = self._append_locked(path, b"".join(pending_file.chunks))
+        if not pending_file.spans:
+            return
+        # The index is written after the data so an entry never points past
+        # the end of the file; entries lost to a crash or error here only cost
+        # readers a scan.
+        index = "".join(
+            f"[{seq},{base + offset},{length}]\n" for seq, offset, length in pending_file.spans
+        ).encode("utf-8")
+        try:
+            self._append_locked(build_seq_index_path(path), index)
+        except Exception:
+            logger.exception("cannot update sequence index of %s", path)
+
+    def _append_locked(self, path: Path, data: bytes) -> int:
+        """Append ``data`` to ``path`` and return the offset it was written at."""
+
+        handle = None
+        try:
+            handle = self._open_locked(path)
+            offset = handle.tell()
+            handle.write(data)
+            handle.flush()
+            if self.fsync:
+                os.fsync(handle.fileno())
+            return offset
+        except BaseException:
+            # Reopen the file on the next attempt.
+            if handle is not None:
+                self._handles.pop(path, None)
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+            raise
+
+    def _open_locked(self, path: Path):
+        handle = self._handles.get(path)
+        if handle is not None:
+            self._handles.move_to_end(path)
+            return handle
+        while len(self._handles) >= self.max_open_files:
+            _, evicted = self._handles.popitem(last=False)
+            evicted.close()
+        ensure_dir(str(path.parent))
+        restore_compacted_file(path)
+        handle = open(path, "ab")
+        self._handles[path] = handle
+        return handle
+
+
+def open_jsonl_writer(config: dict) -> JsonlWriter:
+    return JsonlWriter(
+        max_open_files=config["output_max_open_files"],
+        flush_bytes=config["output_flush_bytes"],
+        fsync=config["output_fsync"],
+        background=config["output_background"],
+        queue_bytes=config["output_queue_bytes"],
+        index_sequences=config.get("output_seq_index", False),
+    )
+
+
+def read_output_layout(base_dir: str) -> dict:
+    """Return the layout recorded in ``base_dir/.layout.json`` (flat when absent).
+
+    The result is cached per directory for the life of the process, so the
+    layout must not be migrated while an exporter is running.
+    """
+
+    key = str(base_dir)
+    layout = _output_layouts.get(key)
+    if layout is None:
+        layout = {"version": 1, "layout": "flat"}
+        try:
+            with open(Path(base_dir) / LAYOUT_FILE_NAME, "rb") as f:
+                data = json_codec.loads(f.read())
+            if isinstance(data, dict) and data.get("layout") in OUTPUT_LAYOUTS:
+                layout = data
+        except FileNotFoundError:
+            pass
+        _output_layouts[key] = layout
+    return layout
+
+
+def write_output_layout(base_dir: str, layout_name: str) -> dict:
+    layout = dict(HASHED_LAYOUT) if layout_name == "hashed" else {"version": 1, "layout": "flat"}
+    ensure_dir(str(base_dir))
+    path = Path(base_dir) / LAYOUT_FILE_NAME
+    tmp_path = path.with_name(f"{LAYOUT_FILE_NAME}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json_codec.dumps(layout))
+        f.write("\n")
+    os.replace(tmp_path, path)
+    _output_layouts[str(base_dir)] = layout
+    return layout
+
+
+def ensure_output_layout(base_dir: str, layout_name: str) -> None:
+    """Record ``layout_name`` for a new directory, or check it matches an existing one."""
+
+    current = read_output_layout(base_dir)["layout"]
+    if current == layout_name:
+        return
+    try:
+        has_files = any(not entry.name.startswith(".") for entry in os.scandir(base_dir))
+    except FileNotFoundError:
+        has_files = False
+    if has_files:
+        raise ValueError(
+            f"{base_dir} uses the {current} layout; stop the exporter and run "
+            f"python3 src/migrate_layout.py --layout {layout_name} {base_dir}"
+        )
+    write_output_layout(base_dir, layout_name)
+
+
+def build_layout_relative_path(layout: dict, safe_id: str, suffix: str = ".json") -> Path:
+    """Path of a session file relative to its base directory.
+
+    The hashed layout nests files under prefixes of sha256(safe_id) in hex,
+    e.g. ``ab/cd/<safe_id>.json`` for two levels of width two.
+    """
+
+    name = f"{safe_id}{suffix}"
+    if layout.get("layout") != "hashed":
+        return Path(name)
+    digest = hashlib.sha256(safe_id.encode("utf-8")).hexdigest()
+    width = layout.get("width", 2)
+    parts = [digest[i * width : (i + 1) * width] for i in range(layout.get("levels", 2))]
+    return Path(*parts, name)
 
 
 def build_session_file_path(base_dir: str, session_id: str, suffix: str = ".json") -> Path:
     safe_id = sanitize_path_segment(session_id)
-    return Path(base_dir) / f"{safe_id}{suffix}"
+    return Path(base_dir) / build_layout_relative_path(read_output_layout(base_dir), safe_id, suffix)
 
 
 def build_daily_jsonl_path(base_dir: str, dt_value, fallback_name: str = "unknown") -> Path:
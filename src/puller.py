@@ -1,50 +1,101 @@
-"""Usage: python3 src/puller.py [--once]"""
+"""Usage: python3 src/puller.py [--once] [--shard-index N]"""
 
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import logging
+import multiprocessing
+import multiprocessing.connection
+import re
+import signal
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import redis
 
-from config import load_redis_config
-from export_state import STATE_VERSION, load_state, save_state
+import json_codec
+from blob_store import store_blob
+from compactor import compact_file
+from config import build_shard_config, load_redis_config
+from export_state import (
+    STATE_VERSION,
+    JsonStateStore,
+    open_state_store,
+    read_state,
+    state_store_modified_at,
+)
 from output_writer import (
+    JsonlWriter,
+    RawJSON,
     append_jsonl,
+    as_raw_json,
     build_session_file_path,
+    ensure_output_layout,
     normalize_json_value,
+    open_jsonl_writer,
 )
 from session_events import (
+    RESPONSE_PROTOCOLS,
     build_event,
-    extract_response_artifacts_from_response_text,
     extract_raw_tool_events_from_messages,
+    extract_response_artifacts,
     extract_session_events_from_messages,
+    protocol_from_api_type,
     tool_input_to_text,
 )
+from signatures import DIGEST_SIZE, JsonSequenceDigest, json_digest
 
 
 META_RETRY_SECONDS = 30
+REQUEST_BODY_LIST_FIELDS = ("messages", "input", "contents")
+DEDUPED_SIDECAR_TYPES = (
+    "request_headers",
+    "response_headers",
+    "client_request_meta",
+    "upstream_request_meta",
+)
+KEYSPACE_KEY_PATTERNS = ("session:*:seq", "session:*:req:*:response")
 SNAPSHOT_KEYS = ("last_info_signature", "last_usage_signature")
 STATE_DEFAULT = {"version": STATE_VERSION, "sessions": {}}
+SHARD_STATE_STEM_RE = re.compile(r"^(?P<stem>.*)\.shard-(?P<index>\d+)-of-(?P<count>\d+)$")
 logger = logging.getLogger(__name__)
 
 
-def append_session_events(dest_dir: str, session_id: str, events: list[dict]) -> str:
+def _append_records(path: Path, records: list[dict], writer: JsonlWriter | None) -> None:
+    if writer is None:
+        append_jsonl(path, records)
+    else:
+        writer.append(path, records)
+
+
+def append_session_events(
+    dest_dir: str, session_id: str, events: list[dict], writer: JsonlWriter | None = None
+) -> str:
     if not events:
         return "empty"
-    append_jsonl(build_session_file_path(dest_dir, session_id), events)
+    _append_records(build_session_file_path(dest_dir, session_id), events, writer)
     return "appended"
 
 
-def append_session_sidecars(sidecar_dir: str, session_id: str, events: list[dict]) -> str:
+def append_session_sidecars(
+    sidecar_dir: str, session_id: str, events: list[dict], writer: JsonlWriter | None = None
+) -> str:
     if not events:
         return "empty"
-    append_jsonl(build_session_file_path(sidecar_dir, session_id), events)
+    _append_records(build_session_file_path(sidecar_dir, session_id), events, writer)
     return "appended"
 
 
+def _snapshot_entry(entry: dict) -> dict:
+    # Entries hold scalars plus flat dicts (``missing``) that are mutated in
+    # place, so copying one level deep is enough to detect changes.
+    return {key: value.copy() if isinstance(value, dict) else value for key, value in entry.items()}
+
+
 def _get_state_entry(state: dict, session_id: str) -> dict:
     sessions = state.setdefault("sessions", {})
     entry = sessions.get(session_id)
@@ -172,8 +223,33 @@ def _read_hash(r: redis.Redis, key: str) -> dict[str, str]:
         return {}
 
 
-def _stable_signature(payload: dict[str, str]) -> str:
-    return json.dumps(normalize_json_value(payload), ensure_ascii=False, sort_keys=True)
+def _read_session_heads(
+    r: redis.Redis, session_ids: list[str], batch_size: int
+) -> dict[str, dict]:
+    heads: dict[str, dict] = {}
+    chunk_size = max(batch_size, 1)
+    for start in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[start : start + chunk_size]
+        try:
+            pipe = r.pipeline(transaction=False)
+            for session_id in chunk:
+                pipe.hgetall(f"session:{session_id}:info")
+                pipe.hgetall(f"session:{session_id}:usage")
+                pipe.get(f"session:{session_id}:seq")
+            values = pipe.execute(raise_on_error=False)
+        except Exception:
+            logger.exception("pipelined session read failed for %d sessions", len(chunk))
+            continue
+        if not isinstance(values, list) or len(values) != len(chunk) * 3:
+            continue
+        for index, session_id in enumerate(chunk):
+            raw_info, raw_usage, seq_value = values[index * 3 : index * 3 + 3]
+            heads[session_id] = {
+                "info": _decode_redis_hash(raw_info),
+                "usage": _decode_redis_hash(raw_usage),
+                "seq": None if isinstance(seq_value, Exception) else seq_value,
+            }
+    return heads
 
 
 def _build_session_meta_payload(info: dict[str, str]) -> dict:
@@ -196,23 +272,130 @@ def _append_session_snapshot(
     state_key: str,
     event_type: str,
     payload: dict[str, str],
-) -> None:
+    writer: JsonlWriter | None = None,
+) -> bool:
     if not payload:
-        return
-    signature = _stable_signature(payload)
-    if entry.get(state_key) == signature:
-        return
+        return False
+    signature = _json_digest(payload)
+    previous = entry.get(state_key)
+    if previous == signature:
+        return False
+    # Older versions stored the sorted JSON text itself, in json.dumps's
+    # default format. Only reached when the digest differs.
+    if isinstance(previous, str) and previous == json.dumps(
+        normalize_json_value(payload), ensure_ascii=False, sort_keys=True
+    ):
+        entry[state_key] = signature
+        return False
     append_session_sidecars(
         sidecar_dir,
         session_id,
         [build_event(event_type, payload, None)],
+        writer,
     )
     entry[state_key] = signature
+    return True
+
+
+def _digest_default(value):
+    return value.text if isinstance(value, RawJSON) else str(value)
+
 
+def _json_digest(value) -> str:
+    return json_digest(value, default=_digest_default)
 
-def _extract_message_events(raw_messages, seq: int) -> list[dict]:
+
+def _messages_prefix_matches(entry: dict, messages: list) -> bool:
+    seen = entry.get("messages_seen")
+    if not isinstance(seen, int) or not 0 < seen <= len(messages):
+        return False
+    digest = JsonSequenceDigest(default=_digest_default)
+    for message in messages[:seen]:
+        digest.update(message)
+    return digest.hexdigest() == entry.get("messages_prefix")
+
+
+def _load_new_messages(entry: dict, raw_messages) -> tuple[int, object]:
+    """Return ``(offset, messages)``: the messages after the ``offset`` already seen.
+
+    When the raw value still starts with the bytes seen last time followed by
+    a comma, only the appended tail is parsed; the seen bytes are checked with
+    one digest pass rather than re-encoded. Otherwise the whole list is parsed
+    and its prefix compared message by message, so a compaction or an edit
+    anywhere in the history forces a full walk. ``entry`` is advanced to the
+    full list either way.
+    """
+
+    raw = raw_messages.encode("utf-8") if isinstance(raw_messages, str) else raw_messages
+    if not isinstance(raw, bytes):
+        return 0, json_codec.loads(raw_messages)
+    raw = raw.rstrip()
+    end = len(raw) - 1
+    raw_digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    seen = entry.get("messages_seen")
+    seen_bytes = entry.get("messages_raw_bytes")
+
+    tail = None
+    if (
+        raw.endswith(b"]")
+        and isinstance(seen, int)
+        and isinstance(seen_bytes, int)
+        and 0 < seen_bytes <= end
+    ):
+        view = memoryview(raw)
+        raw_digest.update(view[:seen_bytes])
+        if raw_digest.hexdigest() == entry.get("messages_raw_digest"):
+            rest = raw[seen_bytes:end].lstrip()
+            if not rest:
+                tail = []
+            elif rest.startswith(b","):
+                try:
+                    tail = json_codec.loads(b"[" + rest[1:] + b"]")
+                except Exception:
+                    tail = None
+            raw_digest.update(view[seen_bytes:end])
+    if isinstance(tail, list):
+        offset = seen
+        messages = tail
+        prefix = JsonSequenceDigest(default=_digest_default, start=entry.get("messages_prefix"))
+    else:
+        messages = json_codec.loads(raw)
+        if not isinstance(messages, list):
+            return 0, messages
+        offset = seen if _messages_prefix_matches(entry, messages) else 0
+        if offset:
+            prefix = JsonSequenceDigest(default=_digest_default, start=entry["messages_prefix"])
+            messages = messages[offset:]
+        else:
+            prefix = JsonSequenceDigest(default=_digest_default)
+        raw_digest = hashlib.blake2b(raw[:end] if raw.endswith(b"]") else b"", digest_size=DIGEST_SIZE)
+
+    for message in messages:
+        prefix.update(message)
+    entry["messages_seen"] = offset + len(messages)
+    entry["messages_prefix"] = prefix.hexdigest()
+    if raw.endswith(b"]"):
+        entry["messages_raw_bytes"] = end
+        entry["messages_raw_digest"] = raw_digest.hexdigest()
+    else:
+        entry.pop("messages_raw_bytes", None)
+        entry.pop("messages_raw_digest", None)
+    return offset, messages
+
+
+def _extract_message_events(raw_messages, seq: int, entry: dict | None = None) -> list[dict]:
+    """Build events from a ``messages`` value.
+
+    With ``entry`` only messages appended since the previously processed
+    sequence are walked, so history is not re-emitted on every request.
+    """
+
+    offset = 0
     try:
-        messages = json.loads(raw_messages)
+        if entry is None:
+            messages = json_codec.loads(raw_messages)
+        else:
+            offset, messages = _load_new_messages(entry, raw_messages)
     except Exception:
         return []
     if messages is None:
@@ -221,19 +404,32 @@ def _extract_message_events(raw_messages, seq: int) -> list[dict]:
     events: list[dict] = []
     for ev in extract_session_events_from_messages(messages):
         events.append(build_event(ev["type"], ev["payload"], seq))
-    for ev in extract_raw_tool_events_from_messages(messages):
+    for ev in extract_raw_tool_events_from_messages(messages, offset):
         events.append(build_event(ev["type"], ev["payload"], seq))
     return events
 
 
-def _extract_response_events(raw_response, seq: int) -> list[dict]:
-    response_text = _decode_redis_text(raw_response)
+def _extract_response_events(
+    raw_response, seq: int, entry: dict | None = None, declared_protocol: str | None = None
+) -> list[dict]:
+    # Bytes go to the SSE parser undecoded; it decodes one line at a time.
+    if isinstance(raw_response, bytes):
+        response_text = raw_response
+    else:
+        response_text = _decode_redis_text(raw_response)
     if not response_text:
         return []
 
-    answer_text, tool_uses, raw_events = extract_response_artifacts_from_response_text(
-        response_text
+    # The protocol last detected for the session (else its declared apiType)
+    # stands in for trying every protocol on responses that identify none.
+    protocol_hint = declared_protocol
+    if entry is not None and entry.get("response_protocol") in RESPONSE_PROTOCOLS:
+        protocol_hint = entry["response_protocol"]
+    answer_text, tool_uses, raw_events, protocol = extract_response_artifacts(
+        response_text, protocol_hint
     )
+    if entry is not None and protocol is not None:
+        entry["response_protocol"] = protocol
     events: list[dict] = []
     for raw_event in raw_events:
         events.append(build_event(raw_event["type"], raw_event["payload"], seq))
@@ -260,8 +456,8 @@ def _extract_response_events(raw_response, seq: int) -> list[dict]:
     return events
 
 
-def _read_seq_records(r: redis.Redis, session_id: str, seq: int) -> dict[str, bytes | str | None]:
-    keys = {
+def _build_seq_record_keys(session_id: str, seq: int) -> dict[str, str]:
+    return {
         "messages": f"session:{session_id}:req:{seq}:messages",
         "response": f"session:{session_id}:req:{seq}:response",
         "request_body": f"session:{session_id}:req:{seq}:requestBody",
@@ -272,6 +468,10 @@ def _read_seq_records(r: redis.Redis, session_id: str, seq: int) -> dict[str, by
         "request_headers": f"session:{session_id}:req:{seq}:reqHeaders",
         "response_headers": f"session:{session_id}:req:{seq}:resHeaders",
     }
+
+
+def _read_seq_records(r: redis.Redis, session_id: str, seq: int) -> dict[str, bytes | str | None]:
+    keys = _build_seq_record_keys(session_id, seq)
     try:
         values = r.mget(list(keys.values()))
         if isinstance(values, list) and len(values) == len(keys):
@@ -284,56 +484,301 @@ def _read_seq_records(r: redis.Redis, session_id: str, seq: int) -> dict[str, by
     return {name: r.get(key) for name, key in keys.items()}
 
 
+def _read_seq_window(
+    r: redis.Redis, session_id: str, seqs: range
+) -> dict[int, dict[str, bytes | str | None]]:
+    keys_by_seq = {seq: _build_seq_record_keys(session_id, seq) for seq in seqs}
+    flat_keys = [key for keys in keys_by_seq.values() for key in keys.values()]
+    try:
+        values = r.mget(flat_keys)
+        if isinstance(values, list) and len(values) == len(flat_keys):
+            window: dict[int, dict[str, bytes | str | None]] = {}
+            offset = 0
+            for seq, keys in keys_by_seq.items():
+                window[seq] = {
+                    name: values[offset + index]
+                    for index, name in enumerate(keys.keys())
+                }
+                offset += len(keys)
+            return window
+    except Exception:
+        pass
+    return {seq: _read_seq_records(r, session_id, seq) for seq in seqs}
+
+
+def _fit_seq_window(r: redis.Redis, session_id: str, seqs: range, max_bytes: int) -> range:
+    """Trim ``seqs`` to the longest prefix whose stored values fit in ``max_bytes``.
+
+    Value sizes come from one pipelined STRLEN per key, so a single large
+    request body cannot push an MGET over the budget. The first sequence is
+    always kept.
+    """
+
+    if max_bytes <= 0 or len(seqs) <= 1:
+        return seqs
+    pipe = r.pipeline(transaction=False)
+    key_counts = []
+    for seq in seqs:
+        keys = _build_seq_record_keys(session_id, seq)
+        key_counts.append(len(keys))
+        for key in keys.values():
+            pipe.strlen(key)
+    try:
+        lengths = pipe.execute()
+    except Exception:
+        return seqs[:1]
+    total = 0
+    offset = 0
+    for count, key_count in enumerate(key_counts):
+        for length in lengths[offset : offset + key_count]:
+            if isinstance(length, int):
+                total += length
+        offset += key_count
+        if total > max_bytes:
+            return seqs[: max(count, 1)]
+    return seqs
+
+
+def _window_bytes_per_seq(window: dict[int, dict[str, bytes | str | None]]) -> int:
+    window_bytes = 0
+    for records in window.values():
+        for value in records.values():
+            if isinstance(value, (bytes, str)):
+                window_bytes += len(value)
+    return window_bytes // len(window) if window else 0
+
+
+def _window_size(bytes_per_seq, max_seqs: int, max_bytes: int) -> int:
+    max_seqs = max(max_seqs, 1)
+    if max_bytes <= 0 or not isinstance(bytes_per_seq, int) or bytes_per_seq <= 0:
+        return max_seqs
+    return max(1, min(max_seqs, max_bytes // bytes_per_seq))
+
+
 def _parse_json_value(raw_value):
     text = _decode_redis_text(raw_value)
     if text is None:
         return None
     try:
-        return json.loads(text)
+        return json_codec.loads(text)
     except Exception:
         return text
 
 
-def _extract_sidecar_events(records: dict[str, bytes | str | None], seq: int) -> list[dict]:
+def _encode_blob_value(value) -> bytes:
+    return json_codec.dumps(value).encode("utf-8")
+
+
+def _offload_request_body(request_body, raw_size: int, blob_dir: str, min_bytes: int):
+    """Replace large request body fields (system, tools, messages...) with blob refs.
+
+    Fields are stored separately so prompts and tool definitions shared by
+    many sessions are kept once.
+    """
+
+    if raw_size < min_bytes:
+        return request_body
+    if not isinstance(request_body, dict):
+        return store_blob(blob_dir, _encode_blob_value(request_body))
+
+    offloaded = {}
+    for field, value in request_body.items():
+        if isinstance(value, (dict, list, str)):
+            encoded = _encode_blob_value(value)
+            if len(encoded) >= min_bytes:
+                offloaded[field] = store_blob(blob_dir, encoded)
+                continue
+        offloaded[field] = value
+    return offloaded
+
+
+def _build_request_body_delta(
+    entry: dict, request_body: dict, seq: int, keyframe_interval: int
+) -> dict | None:
+    """Diff ``request_body`` against the previous sequence's body.
+
+    Only digests of the previous body are kept in state (``body_chain``), so
+    a delta is produced when the conversation list still starts with the
+    previously seen items and a keyframe is not due; otherwise None is
+    returned and the caller writes the full body as a keyframe. ``body_chain``
+    is always replaced, never mutated, so change detection sees it.
+    """
+
+    list_field = next(
+        (
+            field
+            for field in REQUEST_BODY_LIST_FIELDS
+            if isinstance(request_body.get(field), list)
+        ),
+        None,
+    )
+    items = request_body.get(list_field, []) if list_field else []
+    item_digests = [_json_digest(item) for item in items]
+    field_digests = {
+        field: _json_digest(value)
+        for field, value in request_body.items()
+        if field != list_field
+    }
+
+    previous = entry.get("body_chain")
+    delta = None
+    if (
+        isinstance(previous, dict)
+        and previous.get("list_field") == list_field
+        and isinstance(previous.get("count"), int)
+        and previous["count"] <= len(items)
+        and isinstance(previous.get("since_keyframe"), int)
+        and previous["since_keyframe"] + 1 < keyframe_interval
+        and isinstance(previous.get("fields"), dict)
+    ):
+        count = previous["count"]
+        if _json_digest(item_digests[:count]) == previous.get("prefix"):
+            previous_fields = previous["fields"]
+            delta = {
+                "baseSequence": previous.get("seq"),
+                "set": {
+                    field: request_body[field]
+                    for field, digest in field_digests.items()
+                    if previous_fields.get(field) != digest
+                },
+                "unset": sorted(set(previous_fields) - set(field_digests)),
+            }
+            if list_field:
+                delta["listField"] = list_field
+                delta["listOffset"] = count
+                delta["append"] = items[count:]
+
+    entry["body_chain"] = {
+        "seq": seq,
+        "list_field": list_field,
+        "count": len(items),
+        "prefix": _json_digest(item_digests),
+        "fields": field_digests,
+        "since_keyframe": previous["since_keyframe"] + 1 if delta is not None else 0,
+    }
+    return delta
+
+
+def _sidecar_changed(entry: dict, event_type: str, payload: dict) -> bool:
+    state_key = f"last_{event_type}_signature"
+    signature = _json_digest(payload)
+    previous = entry.get(state_key)
+    if previous == signature:
+        return False
+    entry[state_key] = signature
+    return True
+
+
+def _extract_sidecar_events(
+    records: dict[str, bytes | str | None],
+    seq: int,
+    sidecar_options: dict | None = None,
+    entry: dict | None = None,
+) -> list[dict]:
+    options = sidecar_options or {}
+    blob_dir = options.get("blob_dir")
+    blob_min_bytes = options.get("blob_min_bytes", 0)
+    use_blobs = bool(blob_dir) and blob_min_bytes > 0
+    delta_mode = entry is not None and options.get("request_body_mode") == "delta"
+    raw_json = options.get("raw_json", False)
     events: list[dict] = []
 
-    request_body = _parse_json_value(records.get("request_body"))
-    if request_body is not None:
+    def read_json(name: str):
+        if raw_json:
+            raw_value = as_raw_json(records.get(name))
+            if raw_value is not None:
+                return raw_value
+        return _parse_json_value(records.get(name))
+
+    def read_json_object(name: str):
+        if raw_json:
+            raw_value = as_raw_json(records.get(name), require_object=True)
+            if raw_value is not None:
+                return raw_value
+        value = _parse_json_value(records.get(name))
+        return value if isinstance(value, dict) else None
+
+    # Deltas and blob offloading need the parsed body; otherwise it can be
+    # passed through as raw JSON.
+    raw_request_body = records.get("request_body")
+    raw_request_size = len(raw_request_body) if isinstance(raw_request_body, (bytes, str)) else 0
+    if delta_mode or (use_blobs and raw_request_size >= blob_min_bytes):
+        request_body = _parse_json_value(raw_request_body)
+    else:
+        request_body = read_json("request_body")
+    delta = None
+    if delta_mode:
+        if isinstance(request_body, dict):
+            delta = _build_request_body_delta(
+                entry, request_body, seq, options.get("keyframe_interval", 1)
+            )
+        elif request_body is not None:
+            entry.pop("body_chain", None)
+    if delta is not None:
+        events.append(build_event("request_body_delta", delta, seq))
+    elif request_body is not None:
+        if use_blobs and not isinstance(request_body, RawJSON):
+            request_body = _offload_request_body(
+                request_body, raw_request_size, blob_dir, blob_min_bytes
+            )
         events.append(build_event("request_body", {"body": request_body}, seq))
 
-    special_settings = _parse_json_value(records.get("special_settings"))
+    special_settings = read_json("special_settings")
     if special_settings is not None:
         events.append(
             build_event("request_special_settings", {"items": special_settings}, seq)
         )
 
-    client_request_meta = _parse_json_value(records.get("client_request_meta"))
-    if isinstance(client_request_meta, dict):
+    client_request_meta = read_json_object("client_request_meta")
+    if client_request_meta is not None:
         events.append(build_event("client_request_meta", client_request_meta, seq))
 
-    upstream_request_meta = _parse_json_value(records.get("upstream_request_meta"))
-    if isinstance(upstream_request_meta, dict):
+    upstream_request_meta = read_json_object("upstream_request_meta")
+    if upstream_request_meta is not None:
         events.append(build_event("upstream_request_meta", upstream_request_meta, seq))
 
-    upstream_response_meta = _parse_json_value(records.get("upstream_response_meta"))
-    if isinstance(upstream_response_meta, dict):
+    upstream_response_meta = read_json_object("upstream_response_meta")
+    if upstream_response_meta is not None:
         events.append(build_event("upstream_response_meta", upstream_response_meta, seq))
 
-    request_headers = _parse_json_value(records.get("request_headers"))
-    if isinstance(request_headers, dict):
+    request_headers = read_json_object("request_headers")
+    if request_headers is not None:
         events.append(build_event("request_headers", {"headers": request_headers}, seq))
 
-    response_headers = _parse_json_value(records.get("response_headers"))
-    if isinstance(response_headers, dict):
+    response_headers = read_json_object("response_headers")
+    if response_headers is not None:
         events.append(build_event("response_headers", {"headers": response_headers}, seq))
 
+    if entry is not None and options.get("dedupe_meta"):
+        events = [
+            event
+            for event in events
+            if event["type"] not in DEDUPED_SIDECAR_TYPES
+            or _sidecar_changed(entry, event["type"], event["payload"])
+        ]
+
     response_body = _decode_redis_text(records.get("response"))
     if response_body:
+        if use_blobs:
+            encoded = response_body.encode("utf-8")
+            if len(encoded) >= blob_min_bytes:
+                response_body = store_blob(blob_dir, encoded, content_type="text")
         events.append(build_event("response_body", {"text": response_body}, seq))
 
     return events
 
 
+def _build_sidecar_options(config: dict) -> dict:
+    return {
+        "blob_dir": config["blob_dir"],
+        "blob_min_bytes": config["blob_min_bytes"],
+        "request_body_mode": config["request_body_mode"],
+        "keyframe_interval": config["request_body_keyframe_interval"],
+        "dedupe_meta": config["sidecar_dedupe_meta"],
+        "raw_json": config["sidecar_raw_json"],
+    }
+
+
 def process_session(
     r: redis.Redis,
     state: dict,
@@ -342,21 +787,48 @@ def process_session(
     sidecar_dir: str,
     now_ts: float,
     skip_seconds: int,
+    head: dict | None = None,
+    fetch_max_seqs: int = 1,
+    fetch_max_bytes: int = 0,
+    incremental_messages: bool = False,
+    sidecar_options: dict | None = None,
+    writer: JsonlWriter | None = None,
 ) -> None:
     entry = _get_state_entry(state, session_id)
     cursor_seq = _get_cursor_seq(entry)
     _prune_missing(entry, cursor_seq, now_ts, skip_seconds)
 
-    session_info = _read_hash(r, f"session:{session_id}:info")
-    session_usage = _read_hash(r, f"session:{session_id}:usage")
-    _append_session_snapshot(
-        sidecar_dir, session_id, entry, "last_info_signature", "session_info", session_info
+    if head is None:
+        head = {
+            "info": _read_hash(r, f"session:{session_id}:info"),
+            "usage": _read_hash(r, f"session:{session_id}:usage"),
+            "seq": r.get(f"session:{session_id}:seq"),
+        }
+    session_info = head["info"]
+    session_usage = head["usage"]
+    info_appended = _append_session_snapshot(
+        sidecar_dir,
+        session_id,
+        entry,
+        "last_info_signature",
+        "session_info",
+        session_info,
+        writer,
     )
-    _append_session_snapshot(
-        sidecar_dir, session_id, entry, "last_usage_signature", "session_usage", session_usage
+    usage_appended = _append_session_snapshot(
+        sidecar_dir,
+        session_id,
+        entry,
+        "last_usage_signature",
+        "session_usage",
+        session_usage,
+        writer,
     )
+    # last_activity_at drives compaction of idle session files.
+    if info_appended or usage_appended:
+        entry["last_activity_at"] = now_ts
 
-    seq_value = r.get(f"session:{session_id}:seq")
+    seq_value = head["seq"]
     if not seq_value:
         return
     try:
@@ -377,8 +849,10 @@ def process_session(
                     dest_dir,
                     session_id,
                     [build_event("session_meta", session_meta_payload, None)],
+                    writer,
                 )
                 entry["meta_written"] = True
+                entry["last_activity_at"] = now_ts
                 entry.pop("meta_retry_at", None)
             else:
                 entry["meta_retry_at"] = now_ts + META_RETRY_SECONDS
@@ -389,8 +863,28 @@ def process_session(
         entry["last_rsp_seq"] = cursor_seq
         return
 
+    declared_protocol = protocol_from_api_type(session_info.get("apiType"))
+
+    # Windows are sized from the session's observed bytes per sequence, then
+    # trimmed with STRLEN so one MGET never exceeds fetch_max_bytes.
+    window: dict[int, dict[str, bytes | str | None]] = {}
+    window_size = _window_size(entry.get("fetch_seq_bytes"), fetch_max_seqs, fetch_max_bytes)
     for seq in range(cursor_seq + 1, max_seq + 1):
-        records = _read_seq_records(r, session_id, seq)
+        records = window.pop(seq, None)
+        if records is None:
+            seqs = _fit_seq_window(
+                r,
+                session_id,
+                range(seq, min(seq + window_size, max_seq + 1)),
+                fetch_max_bytes,
+            )
+            window = _read_seq_window(r, session_id, seqs)
+            if fetch_max_bytes > 0:
+                entry["fetch_seq_bytes"] = _window_bytes_per_seq(window)
+            window_size = _window_size(
+                entry.get("fetch_seq_bytes"), fetch_max_seqs, fetch_max_bytes
+            )
+            records = window.pop(seq)
         raw_messages = records.get("messages")
         raw_response = records.get("response")
 
@@ -414,15 +908,31 @@ def process_session(
         ):
             break
 
-        events: list[dict] = []
-        sidecars: list[dict] = []
-        if messages_ready:
-            events.extend(_extract_message_events(raw_messages, seq))
-        if response_ready:
-            events.extend(_extract_response_events(raw_response, seq))
-        sidecars.extend(_extract_sidecar_events(records, seq))
-        append_session_events(dest_dir, session_id, events)
-        append_session_sidecars(sidecar_dir, session_id, sidecars)
+        # Extraction records per-sequence progress in the entry (message
+        # offsets, body chain, sidecar signatures). If writing fails or the
+        # process is stopped mid-sequence, roll that back so a re-export of
+        # this sequence starts from the same point.
+        rollback = _snapshot_entry(entry)
+        try:
+            events: list[dict] = []
+            sidecars: list[dict] = []
+            if messages_ready:
+                events.extend(
+                    _extract_message_events(
+                        raw_messages, seq, entry if incremental_messages else None
+                    )
+                )
+            if response_ready:
+                events.extend(
+                    _extract_response_events(raw_response, seq, entry, declared_protocol)
+                )
+            sidecars.extend(_extract_sidecar_events(records, seq, sidecar_options, entry))
+            append_session_events(dest_dir, session_id, events, writer)
+            append_session_sidecars(sidecar_dir, session_id, sidecars, writer)
+        except BaseException:
+            entry.clear()
+            entry.update(rollback)
+            raise
 
         if not messages_ready:
             _clear_missing(entry, "msg", seq)
@@ -430,6 +940,10 @@ def process_session(
             _clear_missing(entry, "rsp", seq)
 
         cursor_seq = seq
+        entry["cursor_seq"] = cursor_seq
+        entry["last_msg_seq"] = cursor_seq
+        entry["last_rsp_seq"] = cursor_seq
+        entry["last_activity_at"] = now_ts
 
     _prune_missing(entry, cursor_seq, now_ts, skip_seconds)
     entry["cursor_seq"] = cursor_seq
@@ -457,13 +971,73 @@ def scan_sessions(r: redis.Redis) -> list[str]:
     return session_ids
 
 
-def run_once(config: dict) -> None:
-    r = redis.Redis.from_url(config["redis_url"], decode_responses=False)
-    state = load_state(config["state_path"], STATE_DEFAULT)
+def session_shard(session_id: str, shard_count: int) -> int:
+    # crc32 is stable across processes and Python versions, unlike hash().
+    return zlib.crc32(session_id.encode("utf-8")) % max(shard_count, 1)
 
-    now_ts = time.time()
-    session_ids = scan_sessions(r)
+
+def _filter_owned_sessions(config: dict, session_ids: list[str]) -> list[str]:
+    shard_count = config.get("shard_count", 1)
+    if shard_count <= 1:
+        return session_ids
+    shard_index = config["shard_index"]
+    return [
+        session_id
+        for session_id in session_ids
+        if session_shard(session_id, shard_count) == shard_index
+    ]
+
+
+def process_sessions(
+    r: redis.Redis,
+    state: dict,
+    session_ids: list[str],
+    config: dict,
+    now_ts: float,
+    writer: JsonlWriter | None = None,
+    store: JsonStateStore | None = None,
+) -> set[str]:
+    """Export the given sessions and return the IDs whose state entry changed.
+
+    Changed IDs are marked dirty in ``store`` even when the run is cut short,
+    so cursors that advanced before an error or shutdown are still saved.
+    """
+
+    # SCAN may return a key more than once; each session must have exactly one
+    # writer per poll, and entries are created here so workers never resize
+    # state["sessions"] concurrently.
+    session_ids = list(dict.fromkeys(session_ids))
+    before: dict[str, dict | None] = {}
     for session_id in session_ids:
+        existing = state.get("sessions", {}).get(session_id)
+        before[session_id] = _snapshot_entry(existing) if isinstance(existing, dict) else None
+        _get_state_entry(state, session_id)
+    try:
+        _run_sessions(r, state, session_ids, config, now_ts, writer)
+    finally:
+        sessions = state["sessions"]
+        changed = {
+            session_id
+            for session_id in session_ids
+            if sessions.get(session_id) != before[session_id]
+        }
+        if store is not None:
+            store.mark_dirty("sessions", changed)
+    return changed
+
+
+def _run_sessions(
+    r: redis.Redis,
+    state: dict,
+    session_ids: list[str],
+    config: dict,
+    now_ts: float,
+    writer: JsonlWriter | None,
+) -> None:
+    heads = _read_session_heads(r, session_ids, config["session_batch_size"])
+    sidecar_options = _build_sidecar_options(config)
+
+    def run(session_id: str) -> None:
         process_session(
             r,
             state,
@@ -472,25 +1046,484 @@ def run_once(config: dict) -> None:
             config["sidecar_dir"],
             now_ts,
             config["missing_skip_seconds"],
+            head=heads.get(session_id),
+            fetch_max_seqs=config["fetch_max_seqs"],
+            fetch_max_bytes=config["fetch_max_bytes"],
+            incremental_messages=config["incremental_messages"],
+            sidecar_options=sidecar_options,
+            writer=writer,
         )
 
-    save_state(config["state_path"], state)
+    concurrency = config["concurrency"]
+    if concurrency <= 1 or len(session_ids) <= 1:
+        for session_id in session_ids:
+            run(session_id)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run, session_id) for session_id in session_ids]
+            for future in futures:
+                future.result()
+
+
+def _connect(config: dict) -> redis.Redis:
+    return redis.Redis.from_url(config["redis_url"], decode_responses=False)
+
+
+def _prepare_output_dirs(config: dict) -> None:
+    for base_dir in (config["dest_dir"], config["sidecar_dir"]):
+        ensure_output_layout(base_dir, config["output_layout"])
+
+
+def collect_state_garbage(
+    state: dict,
+    live_session_ids: list[str],
+    now_ts: float,
+    grace_seconds: int,
+    archive_path: str | None = None,
+    writer: JsonlWriter | None = None,
+) -> set[str]:
+    """Retire entries of sessions missing from discovery for ``grace_seconds``.
+
+    ``last_seen_at`` is only refreshed once it is a quarter of the grace period
+    old, so live sessions do not become dirty on every poll. Entries without it
+    (older state files) start their grace period now. Returns the IDs whose
+    entry was touched or removed.
+    """
+
+    sessions = state.setdefault("sessions", {})
+    refresh_before = now_ts - grace_seconds / 4
+    changed: set[str] = set()
+    for session_id in live_session_ids:
+        entry = sessions.get(session_id)
+        if not isinstance(entry, dict):
+            continue
+        last_seen_at = entry.get("last_seen_at")
+        if not isinstance(last_seen_at, (int, float)) or last_seen_at < refresh_before:
+            entry["last_seen_at"] = now_ts
+            changed.add(session_id)
+
+    expire_before = now_ts - grace_seconds
+    retired: list[dict] = []
+    for session_id, entry in list(sessions.items()):
+        if not isinstance(entry, dict):
+            sessions.pop(session_id, None)
+            changed.add(session_id)
+            continue
+        last_seen_at = entry.get("last_seen_at")
+        if not isinstance(last_seen_at, (int, float)):
+            entry["last_seen_at"] = now_ts
+            changed.add(session_id)
+            continue
+        if last_seen_at >= expire_before:
+            continue
+        sessions.pop(session_id, None)
+        changed.add(session_id)
+        retired.append(
+            build_event("session_state_retired", {"sessionId": session_id, "entry": entry}, None)
+        )
+
+    if retired and archive_path:
+        _append_records(Path(archive_path), retired, writer)
+    return changed
+
+
+def compact_idle_sessions(
+    state: dict,
+    config: dict,
+    now_ts: float,
+    writer: JsonlWriter | None = None,
+) -> set[str]:
+    """Gzip the files of sessions without output for ``compact_idle_seconds``.
+
+    At most ``compact_batch_size`` sessions are compacted per call, and no
+    new one is started once ``compact_time_budget_ms`` have passed (at least
+    one is, so a backlog always drains). A session is compacted again only
+    after new activity; appending to a compacted file restores it first.
+    Entries without ``last_activity_at`` (older state files) start their idle
+    period now. Returns the IDs whose entry changed.
+    """
+
+    idle_before = now_ts - config["compact_idle_seconds"]
+    budget = config["compact_batch_size"]
+    time_budget = config.get("compact_time_budget_ms", 0) / 1000
+    deadline = time.monotonic() + time_budget if time_budget > 0 else None
+    compacted = 0
+    changed: set[str] = set()
+    for session_id, entry in state.get("sessions", {}).items():
+        if compacted >= budget:
+            break
+        if not isinstance(entry, dict):
+            continue
+        last_activity_at = entry.get("last_activity_at")
+        if not isinstance(last_activity_at, (int, float)):
+            entry["last_activity_at"] = now_ts
+            changed.add(session_id)
+            continue
+        compacted_at = entry.get("compacted_at")
+        if last_activity_at >= idle_before or (
+            isinstance(compacted_at, (int, float)) and compacted_at >= last_activity_at
+        ):
+            continue
+        if compacted and deadline is not None and time.monotonic() >= deadline:
+            break
+        for base_dir in (config["dest_dir"], config["sidecar_dir"]):
+            path = build_session_file_path(base_dir, session_id)
+            if writer is not None:
+                writer.close_file(path)
+            compact_file(path)
+        entry["compacted_at"] = now_ts
+        changed.add(session_id)
+        compacted += 1
+    return changed
+
+
+def _open_state_store(config: dict) -> JsonStateStore:
+    return open_state_store(
+        config["state_path"], STATE_DEFAULT, config["state_backend"], config["output_fsync"]
+    )
+
+
+def _other_layout_state_paths(config: dict) -> list[str]:
+    """State paths written under a different ``SHARD_COUNT`` than ``config``'s."""
+
+    path = Path(config["state_path"])
+    match = SHARD_STATE_STEM_RE.match(path.stem)
+    stem = match.group("stem") if match else path.stem
+    shard_count = config.get("shard_count", 1) if match else 1
+    paths = [] if shard_count == 1 else [str(path.with_name(f"{stem}{path.suffix}"))]
+    # Match every file a backend may leave (.json, .json.journal, .sqlite3).
+    name_re = re.compile(rf"^{re.escape(stem)}\.shard-(\d+)-of-(\d+)(?:\.|$)")
+    layouts = set()
+    for candidate in path.parent.glob(f"{stem}.shard-*"):
+        other = name_re.match(candidate.name)
+        if other and int(other.group(2)) != shard_count:
+            layouts.add((int(other.group(2)), int(other.group(1))))
+    for count, index in sorted(layouts):
+        paths.append(str(path.with_name(f"{stem}.shard-{index}-of-{count}{path.suffix}")))
+    return paths
+
+
+def _open_state(config: dict) -> tuple[JsonStateStore, dict]:
+    """Open and load this process's state, merging newer state from other shard layouts.
+
+    When ``SHARD_COUNT`` changes, each shard takes the sessions it owns from
+    the unsharded state and from state files of any other shard count that
+    were written after its own, so no cursor moves backwards. Where several
+    layouts know a session, the entry with the highest ``cursor_seq`` wins.
+    """
+
+    backend = config["state_backend"]
+    modified_at = state_store_modified_at(config["state_path"], backend)
+    store = _open_state_store(config)
+    state = store.load()
+    sessions = state["sessions"]
+    merged: set[str] = set()
+    for path in _other_layout_state_paths(config):
+        other_modified_at = state_store_modified_at(path, backend)
+        if other_modified_at is None:
+            continue
+        if modified_at is not None and other_modified_at <= modified_at:
+            continue
+        other_sessions = read_state(path, STATE_DEFAULT, backend).get("sessions")
+        if not isinstance(other_sessions, dict):
+            continue
+        for session_id in _filter_owned_sessions(config, list(other_sessions)):
+            entry = other_sessions[session_id]
+            if not isinstance(entry, dict):
+                continue
+            current = sessions.get(session_id)
+            if not isinstance(current, dict) or _get_cursor_seq(entry) > _get_cursor_seq(current):
+                sessions[session_id] = entry
+                merged.add(session_id)
+    if merged:
+        logger.info(
+            "merged %d sessions into %s from other shard layouts",
+            len(merged),
+            config["state_path"],
+        )
+        store.mark_dirty("sessions", merged)
+        store.save(state)
+    return store, state
+
+def poll(
+    r: redis.Redis,
+    store: JsonStateStore,
+    state: dict,
+    config: dict,
+    session_ids: list[str] | None = None,
+    writer: JsonlWriter | None = None,
+) -> None:
+    now_ts = time.time()
+    full_scan = session_ids is None
+    if full_scan:
+        session_ids = scan_sessions(r)
+    session_ids = _filter_owned_sessions(config, session_ids)
+    process_sessions(r, state, session_ids, config, now_ts, writer, store)
+    if full_scan and config["state_gc_grace_seconds"] > 0:
+        store.mark_dirty(
+            "sessions",
+            collect_state_garbage(
+                state,
+                session_ids,
+                now_ts,
+                config["state_gc_grace_seconds"],
+                config["state_archive_path"],
+                writer,
+            ),
+        )
+    # Hand this poll's output to the files; a background writer keeps
+    # going while the next poll runs. Saves wait for it in _save_state.
+    if writer is not None:
+        writer.flush(wait=False)
+    # Compaction is a separate, time-boxed pass after the export so idle
+    # sessions never delay new records.
+    if full_scan and config["compact_idle_seconds"] > 0:
+        store.mark_dirty("sessions", compact_idle_sessions(state, config, now_ts, writer))
+
+
+def run_once(config: dict, session_ids: list[str] | None = None) -> None:
+    _prepare_output_dirs(config)
+    r = _connect(config)
+    store, state = _open_state(config)
+    writer = open_jsonl_writer(config)
+    try:
+        poll(r, store, state, config, session_ids, writer)
+        _save_state(store, state, writer)
+    finally:
+        try:
+            writer.close()
+        finally:
+            store.close()
+
+
+def _save_state(store: JsonStateStore, state: dict, writer: JsonlWriter) -> None:
+    # Cursors in the state only become durable once every record appended
+    # before them is on disk.
+    writer.flush()
+    store.save(state)
+
+
+def _checkpoint(
+    config: dict,
+    store: JsonStateStore,
+    state: dict,
+    last_saved_at: float,
+    writer: JsonlWriter,
+) -> float:
+    now = time.time()
+    if now - last_saved_at < config["checkpoint_interval"]:
+        return last_saved_at
+    _save_state(store, state, writer)
+    return now
+
+
+def _session_id_from_key(key: str) -> str | None:
+    if not key.startswith("session:"):
+        return None
+    rest = key[len("session:") :]
+    if rest.endswith(":seq"):
+        session_id = rest[: -len(":seq")]
+    elif rest.endswith(":response") and ":req:" in rest:
+        session_id = rest.rpartition(":req:")[0]
+    else:
+        return None
+    return session_id or None
+
+
+def _enable_keyspace_events(r: redis.Redis) -> None:
+    # "K" publishes on __keyspace@<db>__ channels and "$" covers SET/INCR.
+    try:
+        current = r.config_get("notify-keyspace-events") or {}
+        flags = _decode_redis_text(
+            current.get("notify-keyspace-events", current.get(b"notify-keyspace-events"))
+        ) or ""
+        has_strings = "$" in flags or "A" in flags
+        if "K" in flags and has_strings:
+            return
+        wanted = flags + ("" if "K" in flags else "K") + ("" if has_strings else "$")
+        r.config_set("notify-keyspace-events", wanted)
+    except Exception:
+        logger.warning(
+            "cannot enable keyspace notifications; set notify-keyspace-events=K$ on the server"
+        )
+
+
+def _subscribe_keyspace_events(r: redis.Redis):
+    db = r.connection_pool.connection_kwargs.get("db", 0)
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe(*(f"__keyspace@{db}__:{pattern}" for pattern in KEYSPACE_KEY_PATTERNS))
+    return pubsub
+
+
+def _collect_touched_sessions(pubsub, timeout: float, debounce: float) -> set[str]:
+    touched: set[str] = set()
+    deadline = None
+    while True:
+        now = time.time()
+        if deadline is None:
+            wait = timeout
+        else:
+            wait = deadline - now
+            if wait <= 0:
+                break
+        message = pubsub.get_message(timeout=max(wait, 0))
+        if message is None:
+            if deadline is None:
+                break
+            continue
+        channel = _decode_redis_text(message.get("channel")) or ""
+        _, separator, key = channel.partition("__:")
+        session_id = _session_id_from_key(key) if separator else None
+        if session_id:
+            touched.add(session_id)
+            if deadline is None:
+                deadline = time.time() + debounce
+    return touched
+
+
+def run_event_loop(
+    config: dict, r: redis.Redis, store: JsonStateStore, state: dict, writer: JsonlWriter
+) -> None:
+    """Export touched sessions as keyspace events arrive.
+
+    A full SCAN still runs every poll interval to pick up anything whose
+    notification was missed (disconnects, servers without notifications).
+    """
+
+    _enable_keyspace_events(r)
+    pubsub = _subscribe_keyspace_events(r)
+    debounce = max(config["keyspace_debounce_ms"], 0) / 1000
+    next_reconcile = 0.0
+    last_saved_at = time.time()
+
+    while True:
+        now = time.time()
+        if now >= next_reconcile:
+            poll(r, store, state, config, writer=writer)
+            last_saved_at = _checkpoint(config, store, state, last_saved_at, writer)
+            next_reconcile = time.time() + config["poll_interval"]
+            continue
+        try:
+            touched = _collect_touched_sessions(pubsub, next_reconcile - now, debounce)
+        except Exception:
+            logger.exception("keyspace subscription failed; falling back to a full scan")
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+            time.sleep(1)
+            pubsub = _subscribe_keyspace_events(r)
+            next_reconcile = 0.0
+            continue
+        if touched:
+            poll(r, store, state, config, sorted(touched), writer)
+            last_saved_at = _checkpoint(config, store, state, last_saved_at, writer)
+
+
+def _raise_system_exit(signum, frame) -> None:
+    raise SystemExit(0)
+
+
+def run_forever(config: dict) -> None:
+    """Daemon loop keeping the Redis pool and parsed state resident.
+
+    State is written every checkpoint interval and once more on exit, so a
+    SIGTERM from systemd or the shard supervisor does not lose progress.
+    """
+
+    _prepare_output_dirs(config)
+    r = _connect(config)
+    store, state = _open_state(config)
+    writer = open_jsonl_writer(config)
+    signal.signal(signal.SIGTERM, _raise_system_exit)
+    try:
+        if config["keyspace_events"]:
+            run_event_loop(config, r, store, state, writer)
+            return
+
+        last_saved_at = time.time()
+        while True:
+            poll(r, store, state, config, writer=writer)
+            last_saved_at = _checkpoint(config, store, state, last_saved_at, writer)
+            time.sleep(config["poll_interval"])
+    finally:
+        # State is only saved once buffered output is on disk.
+        try:
+            writer.close()
+            store.save(state)
+        finally:
+            store.close()
+
+
+def _run_shard(config: dict, once: bool) -> None:
+    if once:
+        run_once(config)
+    else:
+        run_forever(config)
+
+
+def run_supervisor(config: dict, once: bool) -> int:
+    """Fork one worker per shard and wait for them.
+
+    In daemon mode a worker should never exit, so the first exit stops the
+    remaining workers and returns non-zero to let systemd restart the group.
+    """
+
+    # Without this, a plain SIGTERM (docker stop, kill) ends the supervisor
+    # without running the finally below and orphans the workers.
+    signal.signal(signal.SIGTERM, _raise_system_exit)
+    workers = [
+        multiprocessing.Process(
+            target=_run_shard,
+            args=(build_shard_config(config, shard_index), once),
+            name=f"redis-puller-shard-{shard_index}",
+        )
+        for shard_index in range(config["shard_count"])
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        if once:
+            for worker in workers:
+                worker.join()
+            return max(abs(worker.exitcode or 0) for worker in workers)
+
+        multiprocessing.connection.wait([worker.sentinel for worker in workers])
+        for worker in workers:
+            if worker.exitcode is not None:
+                logger.error("%s exited with code %s", worker.name, worker.exitcode)
+        return 1
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--once", action="store_true", help="run once and exit")
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=None,
+        help="run a single shard instead of supervising all SHARD_COUNT shards",
+    )
     args = parser.parse_args()
 
     config = load_redis_config()
 
-    if args.once:
-        run_once(config)
-        return
+    if config["shard_count"] > 1:
+        shard_index = args.shard_index
+        if shard_index is None and config["shard_index"] >= 0:
+            shard_index = config["shard_index"]
+        if shard_index is None:
+            raise SystemExit(run_supervisor(config, args.once))
+        config = build_shard_config(config, shard_index)
 
-    while True:
-        run_once(config)
-        time.sleep(config["poll_interval"])
+    _run_shard(config, args.once)
 
 
 if __name__ == "__main__":
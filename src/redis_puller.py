@@ -1,4 +1,4 @@
-"""Usage: python3 src/redis_puller.py [--once]"""
+"""Usage: python3 src/redis_puller.py [--once] [--shard-index N]"""
 
 from puller import main
 
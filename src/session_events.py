@@ -4,6 +4,34 @@ import json
 import re
 from datetime import datetime, timezone
 
+import json_codec
+from signatures import json_digest
+
+IGNORED_USER_TEXT_PREFIXES = (
+    "# AGENTS.md instructions",
+    "<environment_context>",
+    "# System Instructions",
+    "# Conversation",
+)
+_WHITESPACE_RE = re.compile(r"\s*")
+_NON_WHITESPACE_RE = re.compile(r"\S")
+
+RESPONSE_PROTOCOLS = ("claude", "openai", "response", "gemini")
+# apiType / provider type values seen in session info. Ambiguous ones (like
+# "chat", used for both Claude and OpenAI chat requests) are left out.
+API_TYPE_PROTOCOLS = {
+    "claude": "claude",
+    "claude-auth": "claude",
+    "anthropic": "claude",
+    "openai": "openai",
+    "openai-compatible": "openai",
+    "codex": "response",
+    "response": "response",
+    "responses": "response",
+    "gemini": "gemini",
+    "gemini-cli": "gemini",
+}
+
 
 def sanitize_path_segment(value: str) -> str:
     sanitized = re.sub(r"[^a-zA-Z0-9_.:-]", "_", value)
@@ -24,26 +52,56 @@ def build_event(event_type: str, payload: dict, request_sequence: int | None) ->
 
 
 def should_ignore_user_text(text: str) -> bool:
-    trimmed = text.strip()
-    if not trimmed:
+    # Same as checking text.strip(), without copying long messages.
+    first = _NON_WHITESPACE_RE.search(text)
+    if first is None:
         return True
-    return (
-        trimmed.startswith("# AGENTS.md instructions")
-        or trimmed.startswith("<environment_context>")
-        or trimmed.startswith("# System Instructions")
-        or trimmed.startswith("# Conversation")
-    )
+    return text.startswith(IGNORED_USER_TEXT_PREFIXES, first.start())
 
 
 def extract_user_lines_from_conversation_text(text: str) -> list[str]:
+    # Single forward scan with the semantics of
+    #   (?:^|\r?\n)User:\s*\r?\n([\s\S]*?)(?=(?:\r?\nAssistant:|\r?\nUser:|\s*$))
+    # A block starts after the last line break of the whitespace following
+    # "User:" and ends at the next "\nUser:"/"\nAssistant:" line or at the
+    # trailing whitespace, whichever comes first.
     results: list[str] = []
-    pattern = re.compile(
-        r"(?:^|\r?\n)User:\s*\r?\n([\s\S]*?)(?=(?:\r?\nAssistant:|\r?\nUser:|\s*$))"
-    )
-    for match in pattern.finditer(text):
-        candidate = (match.group(1) or "").strip()
+    content_end = len(text.rstrip())
+    # Next occurrence of each block delimiter, found lazily and reused while
+    # it is still ahead of the scan (len(text) when there is none).
+    next_delimiter = {"\nUser:": -1, "\nAssistant:": -1}
+    pos = 0
+    label_end = 5 if text.startswith("User:") else -1
+    while True:
+        if label_end < 0:
+            index = text.find("\nUser:", pos)
+            if index < 0:
+                break
+            label_end = index + 6
+        whitespace_end = _WHITESPACE_RE.match(text, label_end).end()
+        line_break = text.rfind("\n", label_end, whitespace_end)
+        if line_break < 0:
+            # "User:" followed by text on the same line is not a block header.
+            pos = label_end - 5
+            label_end = -1
+            continue
+
+        start = line_break + 1
+        end = max(start, content_end)
+        for delimiter, index in next_delimiter.items():
+            if index < start:
+                index = text.find(delimiter, start)
+                if index < 0:
+                    index = len(text)
+                next_delimiter[delimiter] = index
+            if index < end:
+                end = index
+
+        candidate = text[start:end].strip()
         if candidate:
             results.append(candidate)
+        pos = end
+        label_end = -1
     return results
 
 
@@ -94,13 +152,6 @@ def _string_or_none(value) -> str | None:
     return value if isinstance(value, str) and value else None
 
 
-def _json_signature(value) -> str:
-    try:
-        return json.dumps(value, ensure_ascii=False, sort_keys=True)
-    except Exception:
-        return str(value)
-
-
 def _append_raw_tool_event(
     events: list[dict],
     event_type: str,
@@ -143,7 +194,7 @@ def _dedupe_raw_tool_events(events: list[dict]) -> list[dict]:
     deduped: list[dict] = []
     seen: set[str] = set()
     for event in events:
-        signature = _json_signature(
+        signature = json_digest(
             {
                 "type": event.get("type"),
                 "payload": event.get("payload"),
@@ -228,12 +279,12 @@ def _extract_raw_tool_events_from_content_part(
         )
 
 
-def extract_raw_tool_events_from_messages(messages) -> list[dict]:
+def extract_raw_tool_events_from_messages(messages, message_index_offset: int = 0) -> list[dict]:
     if not isinstance(messages, list):
         return []
 
     events: list[dict] = []
-    for message_index, message in enumerate(messages):
+    for message_index, message in enumerate(messages, message_index_offset):
         if not isinstance(message, dict):
             continue
 
@@ -408,50 +459,48 @@ def extract_session_events_from_messages(messages) -> list[dict]:
     return user_events + tool_output_events
 
 
-def is_sse_text(text: str) -> bool:
+def _iter_lines(text: str | bytes):
+    # Same pieces as text.split("\n"), produced one at a time.
+    newline = "\n" if isinstance(text, str) else b"\n"
     start = 0
-    length = len(text)
-    i = 0
-    while i <= length:
-        if i != length and text[i] != "\n":
-            i += 1
-            continue
-        line = text[start:i].strip()
-        start = i + 1
-        if not line:
-            i += 1
-            continue
-        if line.startswith(":"):
-            i += 1
+    while True:
+        end = text.find(newline, start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def is_sse_text(text: str | bytes) -> bool:
+    for line in _iter_lines(text):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.strip()
+        if not line or line.startswith(":"):
             continue
         return line.startswith("event:") or line.startswith("data:")
     return False
 
 
-def parse_sse_data(sse_text: str) -> list[dict]:
-    events: list[dict] = []
+def iter_sse_events(sse_text: str | bytes):
+    """Yield ``{"event", "data"}`` dicts from SSE text as they are decoded.
+
+    ``bytes`` input is decoded line by line and raises ``UnicodeDecodeError``
+    when it is not valid UTF-8.
+    """
+
     event_name = ""
     data_lines: list[str] = []
-
-    def flush_event():
-        nonlocal event_name, data_lines
-        if not data_lines:
-            event_name = ""
-            data_lines = []
-            return
-        data_str = "\n".join(data_lines)
-        try:
-            data = json.loads(data_str)
-        except Exception:
-            data = data_str
-        events.append({"event": event_name or "message", "data": data})
-        event_name = ""
-        data_lines = []
-
-    for raw_line in sse_text.split("\n"):
+    for raw_line in _iter_lines(sse_text):
+        if isinstance(raw_line, bytes):
+            raw_line = raw_line.decode("utf-8")
         line = raw_line.rstrip("\n\r")
         if not line:
-            flush_event()
+            if data_lines:
+                yield _build_sse_event(event_name, data_lines)
+            event_name = ""
+            data_lines = []
             continue
         if line.startswith(":"):
             continue
@@ -463,8 +512,21 @@ def parse_sse_data(sse_text: str) -> list[dict]:
             if value.startswith(" "):
                 value = value[1:]
             data_lines.append(value)
-    flush_event()
-    return events
+    if data_lines:
+        yield _build_sse_event(event_name, data_lines)
+
+
+def _build_sse_event(event_name: str, data_lines: list[str]) -> dict:
+    data_str = "\n".join(data_lines)
+    try:
+        data = json_codec.loads(data_str)
+    except Exception:
+        data = data_str
+    return {"event": event_name or "message", "data": data}
+
+
+def parse_sse_data(sse_text: str | bytes) -> list[dict]:
+    return list(iter_sse_events(sse_text))
 
 
 def _append_text(parts: list[str], value) -> None:
@@ -479,7 +541,7 @@ def _parse_tool_input(value):
     if not trimmed:
         return value
     try:
-        return json.loads(trimmed)
+        return json_codec.loads(trimmed)
     except Exception:
         return value
 
@@ -741,14 +803,34 @@ def _extract_raw_tool_events_from_gemini_object(payload: dict, raw_events: list[
                 )
 
 
-def _extract_from_claude_stream_events(
-    events: list[dict], text_parts: list[str], tool_uses: list[dict]
-):
-    tool_use_by_index: dict[int, dict] = {}
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
+class _StreamVisitor:
+    """Collects one protocol's answer text, tool uses and raw tool events.
+
+    ``visit`` is called once per SSE event payload and ``finish`` once at the
+    end, so every protocol needs a single pass over the event list.
+    """
+
+    def __init__(self):
+        self.text_parts: list[str] = []
+        self.tool_uses: list[dict] = []
+        self.raw_events: list[dict] = []
+
+    def visit(self, data: dict) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> None:
+        pass
+
+
+class _ClaudeStreamVisitor(_StreamVisitor):
+    def __init__(self):
+        super().__init__()
+        # Tool uses by content index, in first-seen order. Entries only become
+        # raw tool events once their content_block_start was seen.
+        self.tool_use_by_index: dict[int, dict] = {}
+        self.unordered_tool_uses: list[dict] = []
+
+    def visit(self, data: dict) -> None:
         event_type = data.get("type")
         if event_type == "content_block_start":
             content_block = data.get("content_block")
@@ -760,176 +842,49 @@ def _extract_from_claude_stream_events(
                     "input": content_block.get("input"),
                 }
                 if index is not None:
-                    tool_use_by_index[index] = {**tool_use, "inputJson": None}
+                    self.tool_use_by_index[index] = {**tool_use, "inputJson": None, "started": True}
                 else:
-                    tool_uses.append(tool_use)
+                    self.tool_uses.append(tool_use)
+                    self.unordered_tool_uses.append(tool_use)
         if event_type == "content_block_delta":
             delta = data.get("delta") if isinstance(data.get("delta"), dict) else None
             if delta and delta.get("type") == "text_delta":
-                _append_text(text_parts, delta.get("text"))
+                _append_text(self.text_parts, delta.get("text"))
             if delta and delta.get("type") == "input_json_delta":
                 index = data.get("index") if isinstance(data.get("index"), int) else None
                 if index is not None and isinstance(delta.get("partial_json"), str):
-                    existing = tool_use_by_index.get(index) or {"inputJson": ""}
+                    existing = self.tool_use_by_index.get(index) or {"inputJson": ""}
                     existing["inputJson"] = (existing.get("inputJson") or "") + delta["partial_json"]
-                    tool_use_by_index[index] = existing
-    for entry in tool_use_by_index.values():
-        if entry.get("input") is None and entry.get("inputJson"):
-            entry["input"] = _parse_tool_input(entry.get("inputJson"))
-        tool_uses.append(
-            {
-                "id": entry.get("id"),
-                "name": entry.get("name"),
-                "input": entry.get("input"),
-            }
-        )
-
-
-def _extract_from_openai_stream_events(
-    events: list[dict], text_parts: list[str], tool_uses: list[dict]
-):
-    tool_call_map: dict[str, dict] = {}
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
-        choices = data.get("choices")
-        if not isinstance(choices, list):
-            continue
-        for choice in choices:
-            if not isinstance(choice, dict):
-                continue
-            delta = choice.get("delta") if isinstance(choice.get("delta"), dict) else None
-            if delta:
-                _append_text(text_parts, delta.get("content"))
-                tool_calls = delta.get("tool_calls")
-                if isinstance(tool_calls, list):
-                    for tool_call in tool_calls:
-                        if not isinstance(tool_call, dict):
-                            continue
-                        func = tool_call.get("function")
-                        index = tool_call.get("index") if isinstance(tool_call.get("index"), int) else None
-                        key = (
-                            tool_call.get("id")
-                            if isinstance(tool_call.get("id"), str)
-                            else f"index:{index if index is not None else len(tool_call_map)}"
-                        )
-                        existing = tool_call_map.get(key) or {
-                            "id": tool_call.get("id") if isinstance(tool_call.get("id"), str) else None,
-                            "name": None,
-                            "args": "",
-                        }
-                        if isinstance(func, dict) and isinstance(func.get("name"), str):
-                            existing["name"] = func.get("name")
-                        if isinstance(func, dict) and isinstance(func.get("arguments"), str):
-                            existing["args"] += func.get("arguments")
-                        tool_call_map[key] = existing
-    for entry in tool_call_map.values():
-        tool_uses.append(
-            {
-                "id": entry.get("id"),
-                "name": entry.get("name"),
-                "input": _parse_tool_input(entry.get("args")) if entry.get("args") else None,
-            }
-        )
-
+                    self.tool_use_by_index[index] = existing
 
-def _extract_from_response_stream_events(
-    events: list[dict], text_parts: list[str], tool_uses: list[dict]
-):
-    final_response_obj: dict | None = None
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
-        response_obj = data.get("response")
-        if isinstance(response_obj, dict):
-            final_response_obj = response_obj
-
-    if final_response_obj is not None:
-        before_len = len(text_parts)
-        _extract_from_response_api_object(final_response_obj, text_parts, tool_uses)
-        if len(text_parts) != before_len:
-            return
-
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
-        event_type = data.get("type") if isinstance(data.get("type"), str) else ""
-        if event_type in {"response.output_text.delta", "response.output_text.done"}:
-            delta = data.get("delta")
-            if isinstance(delta, str):
-                _append_text(text_parts, delta)
-            elif isinstance(delta, dict):
-                _append_text(text_parts, delta.get("text"))
-        if event_type in {"response.output_item.added", "response.output_item.done"}:
-            item = data.get("item")
-            if isinstance(item, dict):
-                _extract_from_response_api_object({"output": [item]}, text_parts, tool_uses)
-        if "function_call" in event_type:
-            name = None
-            if isinstance(data.get("name"), str):
-                name = data.get("name")
-            elif isinstance(data.get("function"), dict) and isinstance(data["function"].get("name"), str):
-                name = data["function"]["name"]
-            args = data.get("arguments")
-            if args is None and isinstance(data.get("function"), dict):
-                args = data["function"].get("arguments")
-            if name or args is not None:
-                tool_uses.append({"name": name, "input": _parse_tool_input(args)})
-
-
-def _extract_raw_tool_events_from_claude_stream_events(
-    events: list[dict], raw_events: list[dict]
-):
-    tool_use_by_index: dict[int, dict] = {}
-    unordered_tool_uses: list[dict] = []
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
-        event_type = data.get("type")
-        if event_type == "content_block_start":
-            content_block = data.get("content_block")
-            if isinstance(content_block, dict) and content_block.get("type") == "tool_use":
-                index = data.get("index") if isinstance(data.get("index"), int) else None
-                block = {
-                    "type": "tool_use",
-                    "id": content_block.get("id") if isinstance(content_block.get("id"), str) else None,
-                    "name": content_block.get("name") if isinstance(content_block.get("name"), str) else None,
-                    "input": content_block.get("input"),
-                    "inputJson": None,
+    def finish(self) -> None:
+        for entry in self.tool_use_by_index.values():
+            if entry.get("input") is None and entry.get("inputJson"):
+                entry["input"] = _parse_tool_input(entry.get("inputJson"))
+            self.tool_uses.append(
+                {
+                    "id": entry.get("id"),
+                    "name": entry.get("name"),
+                    "input": entry.get("input"),
                 }
-                if index is None:
-                    unordered_tool_uses.append(block)
-                else:
-                    tool_use_by_index[index] = block
-        if event_type == "content_block_delta":
-            delta = data.get("delta") if isinstance(data.get("delta"), dict) else None
-            index = data.get("index") if isinstance(data.get("index"), int) else None
-            if delta and delta.get("type") == "input_json_delta":
-                if index is None or not isinstance(delta.get("partial_json"), str):
-                    continue
-                existing = tool_use_by_index.get(index)
-                if not existing:
-                    continue
-                existing["inputJson"] = (existing.get("inputJson") or "") + delta["partial_json"]
-                tool_use_by_index[index] = existing
+            )
+
+        for content_index, entry in sorted(self.tool_use_by_index.items()):
+            if entry.get("started"):
+                self._append_tool_call(entry, content_index)
+        for tool_use in self.unordered_tool_uses:
+            self._append_tool_call(tool_use, None)
 
-    for content_index, block in sorted(tool_use_by_index.items()):
+    def _append_tool_call(self, tool_use: dict, content_index: int | None) -> None:
         raw_block = {"type": "tool_use"}
-        if block.get("id") is not None:
-            raw_block["id"] = block.get("id")
-        if block.get("name") is not None:
-            raw_block["name"] = block.get("name")
-        input_value = block.get("input")
-        if input_value is None and block.get("inputJson"):
-            input_value = _parse_tool_input(block.get("inputJson"))
-        if input_value is not None:
-            raw_block["input"] = input_value
+        if tool_use.get("id") is not None:
+            raw_block["id"] = tool_use.get("id")
+        if tool_use.get("name") is not None:
+            raw_block["name"] = tool_use.get("name")
+        if tool_use.get("input") is not None:
+            raw_block["input"] = tool_use.get("input")
         _append_raw_tool_event(
-            raw_events,
+            self.raw_events,
             "tool_call_raw",
             raw_block,
             source="response_body",
@@ -937,215 +892,311 @@ def _extract_raw_tool_events_from_claude_stream_events(
             message_index=0,
             message_role="assistant",
             content_index=content_index,
-            tool_call_id=_string_or_none(block.get("id")),
-            tool_name=_string_or_none(block.get("name")),
+            tool_call_id=_string_or_none(tool_use.get("id")),
+            tool_name=_string_or_none(tool_use.get("name")),
         )
 
-    for block in unordered_tool_uses:
-        raw_block = {"type": "tool_use"}
-        if block.get("id") is not None:
-            raw_block["id"] = block.get("id")
-        if block.get("name") is not None:
-            raw_block["name"] = block.get("name")
-        if block.get("input") is not None:
-            raw_block["input"] = block.get("input")
-        _append_raw_tool_event(
-            raw_events,
-            "tool_call_raw",
-            raw_block,
-            source="response_body",
-            provider_protocol="claude",
-            message_index=0,
-            message_role="assistant",
-            tool_call_id=_string_or_none(block.get("id")),
-            tool_name=_string_or_none(block.get("name")),
-        )
 
+class _OpenAIStreamVisitor(_StreamVisitor):
+    def __init__(self):
+        super().__init__()
+        # Tool uses and raw tool calls key unnamed calls differently (raw ones
+        # per choice), so the two maps are kept apart.
+        self.tool_call_map: dict[str, dict] = {}
+        self.raw_tool_call_map: dict[str, dict] = {}
 
-def _extract_raw_tool_events_from_openai_stream_events(
-    events: list[dict], raw_events: list[dict]
-):
-    tool_call_map: dict[str, dict] = {}
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
+    def visit(self, data: dict) -> None:
         choices = data.get("choices")
         if not isinstance(choices, list):
-            continue
+            return
         for choice_index, choice in enumerate(choices):
             if not isinstance(choice, dict):
                 continue
             delta = choice.get("delta")
             if not isinstance(delta, dict):
                 continue
+            _append_text(self.text_parts, delta.get("content"))
             tool_calls = delta.get("tool_calls")
             if not isinstance(tool_calls, list):
                 continue
             for tool_call in tool_calls:
                 if not isinstance(tool_call, dict):
                     continue
-                function = tool_call.get("function")
-                content_index = (
-                    tool_call.get("index") if isinstance(tool_call.get("index"), int) else None
-                )
-                key = (
-                    tool_call.get("id")
-                    if isinstance(tool_call.get("id"), str)
-                    else f"{choice_index}:{content_index if content_index is not None else len(tool_call_map)}"
-                )
-                existing = tool_call_map.get(key) or {
-                    "id": tool_call.get("id") if isinstance(tool_call.get("id"), str) else None,
-                    "type": tool_call.get("type") if isinstance(tool_call.get("type"), str) else "function",
-                    "name": None,
-                    "arguments": "",
-                    "messageIndex": choice_index,
-                    "contentIndex": content_index,
-                }
-                if isinstance(function, dict) and isinstance(function.get("name"), str):
-                    existing["name"] = function.get("name")
-                if isinstance(function, dict) and isinstance(function.get("arguments"), str):
-                    existing["arguments"] += function.get("arguments")
-                tool_call_map[key] = existing
-
-    for entry in tool_call_map.values():
-        raw_block = {
-            "type": entry.get("type") or "function",
-            "function": {},
-        }
-        if entry.get("id") is not None:
-            raw_block["id"] = entry.get("id")
-        if entry.get("name") is not None:
-            raw_block["function"]["name"] = entry.get("name")
-        if entry.get("arguments"):
-            raw_block["function"]["arguments"] = entry.get("arguments")
-        _append_raw_tool_event(
-            raw_events,
-            "tool_call_raw",
-            raw_block,
-            source="response_body",
-            provider_protocol="openai_chat",
-            message_index=entry.get("messageIndex"),
-            message_role="assistant",
-            content_index=entry.get("contentIndex"),
-            tool_call_id=_string_or_none(entry.get("id")),
-            tool_name=_string_or_none(entry.get("name")),
+                self._visit_tool_call(tool_call, choice_index)
+
+    def _visit_tool_call(self, tool_call: dict, choice_index: int) -> None:
+        func = tool_call.get("function")
+        name = func.get("name") if isinstance(func, dict) and isinstance(func.get("name"), str) else None
+        arguments = (
+            func.get("arguments")
+            if isinstance(func, dict) and isinstance(func.get("arguments"), str)
+            else None
         )
+        call_id = tool_call.get("id") if isinstance(tool_call.get("id"), str) else None
+        index = tool_call.get("index") if isinstance(tool_call.get("index"), int) else None
 
+        key = call_id if call_id is not None else (
+            f"index:{index if index is not None else len(self.tool_call_map)}"
+        )
+        existing = self.tool_call_map.get(key) or {"id": call_id, "name": None, "args": ""}
+        if name is not None:
+            existing["name"] = name
+        if arguments is not None:
+            existing["args"] += arguments
+        self.tool_call_map[key] = existing
+
+        raw_key = call_id if call_id is not None else (
+            f"{choice_index}:{index if index is not None else len(self.raw_tool_call_map)}"
+        )
+        raw_existing = self.raw_tool_call_map.get(raw_key) or {
+            "id": call_id,
+            "type": tool_call.get("type") if isinstance(tool_call.get("type"), str) else "function",
+            "name": None,
+            "arguments": "",
+            "messageIndex": choice_index,
+            "contentIndex": index,
+        }
+        if name is not None:
+            raw_existing["name"] = name
+        if arguments is not None:
+            raw_existing["arguments"] += arguments
+        self.raw_tool_call_map[raw_key] = raw_existing
+
+    def finish(self) -> None:
+        for entry in self.tool_call_map.values():
+            self.tool_uses.append(
+                {
+                    "id": entry.get("id"),
+                    "name": entry.get("name"),
+                    "input": _parse_tool_input(entry.get("args")) if entry.get("args") else None,
+                }
+            )
 
-def _extract_raw_tool_events_from_response_stream_events(
-    events: list[dict], raw_events: list[dict]
-):
-    final_response_obj: dict | None = None
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
+        for entry in self.raw_tool_call_map.values():
+            raw_block = {
+                "type": entry.get("type") or "function",
+                "function": {},
+            }
+            if entry.get("id") is not None:
+                raw_block["id"] = entry.get("id")
+            if entry.get("name") is not None:
+                raw_block["function"]["name"] = entry.get("name")
+            if entry.get("arguments"):
+                raw_block["function"]["arguments"] = entry.get("arguments")
+            _append_raw_tool_event(
+                self.raw_events,
+                "tool_call_raw",
+                raw_block,
+                source="response_body",
+                provider_protocol="openai_chat",
+                message_index=entry.get("messageIndex"),
+                message_role="assistant",
+                content_index=entry.get("contentIndex"),
+                tool_call_id=_string_or_none(entry.get("id")),
+                tool_name=_string_or_none(entry.get("name")),
+            )
+
+
+class _ResponseStreamVisitor(_StreamVisitor):
+    def __init__(self):
+        super().__init__()
+        self.final_response_obj: dict | None = None
+        # Text and tool uses from individual stream events only count when the
+        # final response object has no text, so they are replayed in finish().
+        self.stream_items: list[tuple] = []
+        self.stream_raw_events: list[dict] = []
+
+    def visit(self, data: dict) -> None:
         response_obj = data.get("response")
         if isinstance(response_obj, dict):
-            final_response_obj = response_obj
+            self.final_response_obj = response_obj
 
-    if final_response_obj is not None:
-        _extract_raw_tool_events_from_response_api_object(final_response_obj, raw_events)
-
-    for event in events:
-        data = event.get("data")
-        if not isinstance(data, dict):
-            continue
         event_type = data.get("type") if isinstance(data.get("type"), str) else ""
+        if event_type in {"response.output_text.delta", "response.output_text.done"}:
+            delta = data.get("delta")
+            if isinstance(delta, str):
+                self.stream_items.append(("text", delta))
+            elif isinstance(delta, dict):
+                self.stream_items.append(("text", delta.get("text")))
         if event_type in {"response.output_item.added", "response.output_item.done"}:
             item = data.get("item")
-            if not isinstance(item, dict):
-                continue
-            item_type = _string_or_none(item.get("type"))
-            if item_type == "function_call":
-                _append_raw_tool_event(
-                    raw_events,
-                    "tool_call_raw",
-                    item,
-                    source="response_body",
-                    provider_protocol="response_api",
-                    message_index=data.get("output_index")
-                    if isinstance(data.get("output_index"), int)
-                    else None,
-                    message_type=item_type,
-                    tool_call_id=_string_or_none(item.get("call_id"))
-                    or _string_or_none(item.get("id")),
-                    tool_name=_string_or_none(item.get("name")),
-                )
-            if item_type == "function_call_output":
-                _append_raw_tool_event(
-                    raw_events,
-                    "tool_result_raw",
-                    item,
-                    source="response_body",
-                    provider_protocol="response_api",
-                    message_index=data.get("output_index")
-                    if isinstance(data.get("output_index"), int)
-                    else None,
-                    message_type=item_type,
-                    tool_use_id=_string_or_none(item.get("call_id"))
-                    or _string_or_none(item.get("id")),
-                    tool_name=_string_or_none(item.get("name")),
-                )
+            if isinstance(item, dict):
+                self.stream_items.append(("item", item))
+                self._visit_raw_item(data, item)
         elif "function_call" in event_type:
-            raw_block = {}
-            for key in ("id", "call_id", "name", "arguments", "input", "type"):
-                if key in data:
-                    raw_block[key] = data.get(key)
-            function = data.get("function")
-            if isinstance(function, dict):
-                raw_block["function"] = function
-            if not raw_block:
-                continue
-            tool_name = _string_or_none(raw_block.get("name"))
-            if tool_name is None and isinstance(function, dict):
-                tool_name = _string_or_none(function.get("name"))
+            self._visit_function_call(data, event_type)
+
+    def _visit_raw_item(self, data: dict, item: dict) -> None:
+        item_type = _string_or_none(item.get("type"))
+        output_index = data.get("output_index") if isinstance(data.get("output_index"), int) else None
+        if item_type == "function_call":
             _append_raw_tool_event(
-                raw_events,
+                self.stream_raw_events,
                 "tool_call_raw",
-                raw_block,
+                item,
                 source="response_body",
                 provider_protocol="response_api",
-                message_type=event_type,
-                tool_call_id=_string_or_none(raw_block.get("call_id"))
-                or _string_or_none(raw_block.get("id")),
-                tool_name=tool_name,
+                message_index=output_index,
+                message_type=item_type,
+                tool_call_id=_string_or_none(item.get("call_id")) or _string_or_none(item.get("id")),
+                tool_name=_string_or_none(item.get("name")),
+            )
+        if item_type == "function_call_output":
+            _append_raw_tool_event(
+                self.stream_raw_events,
+                "tool_result_raw",
+                item,
+                source="response_body",
+                provider_protocol="response_api",
+                message_index=output_index,
+                message_type=item_type,
+                tool_use_id=_string_or_none(item.get("call_id")) or _string_or_none(item.get("id")),
+                tool_name=_string_or_none(item.get("name")),
             )
 
+    def _visit_function_call(self, data: dict, event_type: str) -> None:
+        function = data.get("function")
+        name = None
+        if isinstance(data.get("name"), str):
+            name = data.get("name")
+        elif isinstance(function, dict) and isinstance(function.get("name"), str):
+            name = function["name"]
+        args = data.get("arguments")
+        if args is None and isinstance(function, dict):
+            args = function.get("arguments")
+        if name or args is not None:
+            self.stream_items.append(("tool_use", name, args))
+
+        raw_block = {}
+        for key in ("id", "call_id", "name", "arguments", "input", "type"):
+            if key in data:
+                raw_block[key] = data.get(key)
+        if isinstance(function, dict):
+            raw_block["function"] = function
+        if not raw_block:
+            return
+        tool_name = _string_or_none(raw_block.get("name"))
+        if tool_name is None and isinstance(function, dict):
+            tool_name = _string_or_none(function.get("name"))
+        _append_raw_tool_event(
+            self.stream_raw_events,
+            "tool_call_raw",
+            raw_block,
+            source="response_body",
+            provider_protocol="response_api",
+            message_type=event_type,
+            tool_call_id=_string_or_none(raw_block.get("call_id"))
+            or _string_or_none(raw_block.get("id")),
+            tool_name=tool_name,
+        )
 
-def _detect_sse_format(events: list[dict]) -> str | None:
-    for event in events:
-        data = event.get("data")
+    def finish(self) -> None:
+        if self.final_response_obj is not None:
+            _extract_from_response_api_object(self.final_response_obj, self.text_parts, self.tool_uses)
+            _extract_raw_tool_events_from_response_api_object(self.final_response_obj, self.raw_events)
+        if not self.text_parts:
+            for stream_item in self.stream_items:
+                if stream_item[0] == "text":
+                    _append_text(self.text_parts, stream_item[1])
+                elif stream_item[0] == "item":
+                    _extract_from_response_api_object(
+                        {"output": [stream_item[1]]}, self.text_parts, self.tool_uses
+                    )
+                else:
+                    self.tool_uses.append(
+                        {"name": stream_item[1], "input": _parse_tool_input(stream_item[2])}
+                    )
+        self.raw_events.extend(self.stream_raw_events)
+
+
+class _GeminiStreamVisitor(_StreamVisitor):
+    def visit(self, data: dict) -> None:
+        _extract_from_gemini_object(data, self.text_parts, self.tool_uses)
+        _extract_raw_tool_events_from_gemini_object(data, self.raw_events)
+
+
+_STREAM_VISITORS = {
+    "claude": _ClaudeStreamVisitor,
+    "openai": _OpenAIStreamVisitor,
+    "response": _ResponseStreamVisitor,
+    "gemini": _GeminiStreamVisitor,
+}
+
+
+def _extract_from_stream_events(
+    events,
+    text_parts: list[str],
+    tool_uses: list[dict],
+    raw_events: list[dict],
+    protocol_hint: str | None = None,
+) -> str | None:
+    # Payloads are held back only until one of them identifies the protocol
+    # (normally the first); the rest go straight from the parser to the visitor.
+    payloads = (event.get("data") for event in events)
+    sniffed: list[dict] = []
+    detected_format = None
+    for data in payloads:
         if not isinstance(data, dict):
             continue
-
-        if isinstance(data.get("choices"), list):
-            return "openai"
-        if isinstance(data.get("candidates"), list):
-            return "gemini"
-        if isinstance(data.get("output"), list):
+        sniffed.append(data)
+        detected_format = _detect_sse_format(data)
+        if detected_format is not None:
+            break
+
+    # Without a format or hint every protocol's visitor is fed in the same
+    # pass; their results are concatenated in the order of _STREAM_VISITORS.
+    protocol = detected_format or protocol_hint
+    if protocol in _STREAM_VISITORS:
+        visitors = [_STREAM_VISITORS[protocol]()]
+        visit = visitors[0].visit
+    else:
+        visitors = [visitor_class() for visitor_class in _STREAM_VISITORS.values()]
+
+        def visit(data: dict) -> None:
+            for visitor in visitors:
+                visitor.visit(data)
+
+    for data in sniffed:
+        visit(data)
+    sniffed.clear()
+    for data in payloads:
+        if isinstance(data, dict):
+            visit(data)
+    for visitor in visitors:
+        visitor.finish()
+        text_parts.extend(visitor.text_parts)
+        tool_uses.extend(visitor.tool_uses)
+        raw_events.extend(visitor.raw_events)
+    return detected_format
+
+
+def _detect_sse_format(data: dict) -> str | None:
+    if isinstance(data.get("choices"), list):
+        return "openai"
+    if isinstance(data.get("candidates"), list):
+        return "gemini"
+    if isinstance(data.get("output"), list):
+        return "response"
+    if isinstance(data.get("response"), dict):
+        response_obj = data.get("response")
+        if isinstance(response_obj.get("output"), list):
             return "response"
-        if isinstance(data.get("response"), dict):
-            response_obj = data.get("response")
-            if isinstance(response_obj.get("output"), list):
-                return "response"
-            if isinstance(response_obj.get("candidates"), list):
-                return "gemini"
+        if isinstance(response_obj.get("candidates"), list):
+            return "gemini"
 
-        event_type = data.get("type")
-        if isinstance(event_type, str):
-            if event_type.startswith("response."):
-                return "response"
-            if event_type in {
-                "message_start",
-                "message_stop",
-                "content_block_start",
-                "content_block_delta",
-                "content_block_stop",
-                "message_delta",
-            }:
-                return "claude"
+    event_type = data.get("type")
+    if isinstance(event_type, str):
+        if event_type.startswith("response."):
+            return "response"
+        if event_type in {
+            "message_start",
+            "message_stop",
+            "content_block_start",
+            "content_block_delta",
+            "content_block_stop",
+            "message_delta",
+        }:
+            return "claude"
     return None
 
 
@@ -1175,14 +1226,9 @@ def _tool_use_signature(tool_use: dict) -> str | None:
     normalized = {
         "id": tool_use.get("id") if isinstance(tool_use.get("id"), str) else None,
         "name": tool_use.get("name") if isinstance(tool_use.get("name"), str) else None,
-        "input": None,
+        "input": tool_use.get("input"),
     }
-    input_value = tool_use.get("input")
-    try:
-        normalized["input"] = json.dumps(input_value, ensure_ascii=False, sort_keys=True)
-    except Exception:
-        normalized["input"] = str(input_value)
-    return json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return json_digest(normalized)
 
 
 def _dedupe_tool_uses(tool_uses: list[dict]) -> list[dict]:
@@ -1197,76 +1243,71 @@ def _dedupe_tool_uses(tool_uses: list[dict]) -> list[dict]:
     return deduped
 
 
-def extract_response_artifacts_from_response_text(
-    response_text: str,
-) -> tuple[str | None, list[dict], list[dict]]:
+def protocol_from_api_type(api_type) -> str | None:
+    """Map a session's ``apiType`` to the response protocol it declares, if known."""
+
+    if not isinstance(api_type, str):
+        return None
+    return API_TYPE_PROTOCOLS.get(api_type.strip().lower())
+
+
+def extract_response_artifacts(
+    response_text: str | bytes,
+    protocol_hint: str | None = None,
+) -> tuple[str | None, list[dict], list[dict], str | None]:
+    """Return answer text, tool uses, raw tool events and the detected protocol.
+
+    ``protocol_hint`` (one of ``RESPONSE_PROTOCOLS``) is used instead of trying
+    every protocol when the response itself does not identify one; a response
+    that does identify its protocol is always parsed as that protocol.
+    """
+
     text_parts: list[str] = []
     tool_uses: list[dict] = []
     raw_events: list[dict] = []
 
+    if protocol_hint not in RESPONSE_PROTOCOLS:
+        protocol_hint = None
+
     if is_sse_text(response_text):
-        events = [
-            evt
-            for evt in parse_sse_data(response_text)
-            if not (
-                isinstance(evt.get("data"), str)
-                and evt.get("data").strip() == "[DONE]"
+        try:
+            detected_format = _extract_from_stream_events(
+                iter_sse_events(response_text), text_parts, tool_uses, raw_events, protocol_hint
             )
-        ]
-        detected_format = _detect_sse_format(events)
-        if detected_format == "claude":
-            _extract_from_claude_stream_events(events, text_parts, tool_uses)
-            _extract_raw_tool_events_from_claude_stream_events(events, raw_events)
-        elif detected_format == "openai":
-            _extract_from_openai_stream_events(events, text_parts, tool_uses)
-            _extract_raw_tool_events_from_openai_stream_events(events, raw_events)
-        elif detected_format == "response":
-            _extract_from_response_stream_events(events, text_parts, tool_uses)
-            _extract_raw_tool_events_from_response_stream_events(events, raw_events)
-        elif detected_format == "gemini":
-            for evt in events:
-                if isinstance(evt.get("data"), dict):
-                    _extract_from_gemini_object(evt.get("data"), text_parts, tool_uses)
-                    _extract_raw_tool_events_from_gemini_object(evt.get("data"), raw_events)
-        else:
-            _extract_from_claude_stream_events(events, text_parts, tool_uses)
-            _extract_from_openai_stream_events(events, text_parts, tool_uses)
-            _extract_from_response_stream_events(events, text_parts, tool_uses)
-            _extract_raw_tool_events_from_claude_stream_events(events, raw_events)
-            _extract_raw_tool_events_from_openai_stream_events(events, raw_events)
-            _extract_raw_tool_events_from_response_stream_events(events, raw_events)
-            for evt in events:
-                if isinstance(evt.get("data"), dict):
-                    _extract_from_gemini_object(evt.get("data"), text_parts, tool_uses)
-                    _extract_raw_tool_events_from_gemini_object(evt.get("data"), raw_events)
+        except UnicodeDecodeError:
+            # Same as text that could not be decoded in the first place.
+            return None, [], [], None
         raw_events = _dedupe_raw_tool_events(raw_events)
         tool_uses = _dedupe_tool_uses(tool_uses)
         answer_text = "".join(text_parts)
-        return (answer_text if answer_text.strip() else None, tool_uses, raw_events)
+        return (answer_text if answer_text.strip() else None, tool_uses, raw_events, detected_format)
 
     try:
-        parsed = json.loads(response_text)
+        if isinstance(response_text, bytes):
+            response_text = response_text.decode("utf-8")
+        parsed = json_codec.loads(response_text)
     except Exception:
-        return None, [], []
+        return None, [], [], None
 
     if not isinstance(parsed, dict):
-        return None, [], []
+        return None, [], [], None
 
     detected_format = _detect_json_format(parsed)
+    protocol = detected_format or protocol_hint
     response_obj = parsed.get("response")
-    if detected_format == "claude":
+    if protocol == "claude":
         _extract_from_claude_object(parsed, text_parts, tool_uses)
         _extract_raw_tool_events_from_claude_object(parsed, raw_events)
-    elif detected_format == "openai":
+    elif protocol == "openai":
         _extract_from_openai_chat_object(parsed, text_parts, tool_uses)
         _extract_raw_tool_events_from_openai_chat_object(parsed, raw_events)
-    elif detected_format == "response":
+    elif protocol == "response":
         if isinstance(response_obj, dict):
             _extract_from_response_api_object(response_obj, text_parts, tool_uses)
             _extract_raw_tool_events_from_response_api_object(response_obj, raw_events)
         _extract_from_response_api_object(parsed, text_parts, tool_uses)
         _extract_raw_tool_events_from_response_api_object(parsed, raw_events)
-    elif detected_format == "gemini":
+    elif protocol == "gemini":
         if isinstance(response_obj, dict):
             _extract_from_gemini_object(response_obj, text_parts, tool_uses)
             _extract_raw_tool_events_from_gemini_object(response_obj, raw_events)
@@ -1290,14 +1331,24 @@ def extract_response_artifacts_from_response_text(
     raw_events = _dedupe_raw_tool_events(raw_events)
     tool_uses = _dedupe_tool_uses(tool_uses)
     answer_text = "".join(text_parts)
-    return (answer_text if answer_text.strip() else None, tool_uses, raw_events)
+    return (answer_text if answer_text.strip() else None, tool_uses, raw_events, detected_format)
+
+
+def extract_response_artifacts_from_response_text(
+    response_text: str | bytes,
+    protocol_hint: str | None = None,
+) -> tuple[str | None, list[dict], list[dict]]:
+    answer_text, tool_uses, raw_events, _ = extract_response_artifacts(response_text, protocol_hint)
+    return answer_text, tool_uses, raw_events
 
 
-def extract_raw_tool_events_from_response_text(response_text: str) -> list[dict]:
+def extract_raw_tool_events_from_response_text(response_text: str | bytes) -> list[dict]:
     _, _, raw_events = extract_response_artifacts_from_response_text(response_text)
     return raw_events
 
 
-def extract_llm_artifacts_from_response_text(response_text: str) -> tuple[str | None, list[dict]]:
+def extract_llm_artifacts_from_response_text(
+    response_text: str | bytes,
+) -> tuple[str | None, list[dict]]:
     answer_text, tool_uses, _ = extract_response_artifacts_from_response_text(response_text)
     return answer_text, tool_uses
@@ -0,0 +1,106 @@
+"""Usage: python3 src/sidecar_reader.py SIDECAR_FILE [--seq N] [--blob-dir DIR]
+
+Rebuilds full request bodies from a Redis sidecar file, applying
+request_body_delta events and optionally resolving blob references.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import sys
+from pathlib import Path
+
+from blob_store import is_blob_ref, load_blob
+
+
+def _resolve_blob_refs(value, blob_dir: str | None):
+    if not blob_dir:
+        return value
+    if is_blob_ref(value):
+        data = load_blob(blob_dir, value)
+        if value.get("contentType") == "text":
+            return data.decode("utf-8")
+        return json.loads(data)
+    if isinstance(value, dict):
+        return {key: _resolve_blob_refs(item, blob_dir) for key, item in value.items()}
+    return value
+
+
+def apply_request_body_delta(base_body: dict, delta: dict) -> dict:
+    body = dict(base_body)
+    for field in delta.get("unset") or []:
+        body.pop(field, None)
+    body.update(delta.get("set") or {})
+    list_field = delta.get("listField")
+    if list_field:
+        offset = delta.get("listOffset") or 0
+        base_items = base_body.get(list_field)
+        if is_blob_ref(base_items):
+            raise ValueError(
+                f"{list_field!r} of request {delta.get('baseSequence')} is stored as a blob; "
+                "pass --blob-dir to resolve it"
+            )
+        if not isinstance(base_items, list) or len(base_items) < offset:
+            raise ValueError(f"delta expects {offset} items in {list_field!r}")
+        body[list_field] = base_items[:offset] + list(delta.get("append") or [])
+    return body
+
+
+def iter_request_bodies(path: Path, blob_dir: str | None = None):
+    """Yield ``(requestSequence, body)`` for every request body in file order.
+
+    Bodies are kept by sequence because a restart may re-export sequences and
+    emit deltas whose base is earlier than the previous event.
+    """
+
+    bodies: dict[int, dict] = {}
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except Exception:
+                continue
+            event_type = event.get("type")
+            seq = event.get("requestSequence")
+            payload = event.get("payload")
+            if not isinstance(payload, dict):
+                continue
+            if event_type == "request_body":
+                body = _resolve_blob_refs(payload.get("body"), blob_dir)
+            elif event_type == "request_body_delta":
+                base = bodies.get(payload.get("baseSequence"))
+                if base is None:
+                    continue
+                body = apply_request_body_delta(base, payload)
+            else:
+                continue
+            if isinstance(seq, int) and isinstance(body, dict):
+                bodies[seq] = body
+            yield seq, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="REDIS_SIDECARS_DIR/<session_id>.json (or .json.gz)")
+    parser.add_argument("--seq", type=int, default=None, help="only print this requestSequence")
+    parser.add_argument("--blob-dir", default=None, help="resolve blob references from BLOB_DIR")
+    args = parser.parse_args()
+
+    try:
+        for seq, body in iter_request_bodies(Path(args.path), args.blob_dir):
+            if args.seq is not None and seq != args.seq:
+                continue
+            sys.stdout.write(
+                json.dumps({"requestSequence": seq, "body": body}, ensure_ascii=False)
+            )
+            sys.stdout.write("\n")
+    except (OSError, ValueError) as exc:
+        sys.stdout.flush()
+        parser.error(str(exc))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Fixed-size digests of JSON values for dedupe and change detection.
+
+A value is hashed through its canonical encoding (``json_codec.dumps_bytes``
+with sorted keys), so equal values give equal digests. Only the 32-character
+hex digest is kept, never the encoding. Floats orjson writes in exponent form
+hash differently with and without orjson installed; everything else hashes
+the same with either backend.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+import json_codec
+
+
+DIGEST_SIZE = 16
+
+
+def _encode(value, default) -> bytes:
+    try:
+        return json_codec.dumps_bytes(value, sort_keys=True, default=default, match_json=False)
+    except Exception:
+        return str(value).encode("utf-8", "surrogatepass")
+
+
+def json_digest(value, default=None) -> str:
+    """Return the blake2b hex digest of ``value``'s canonical JSON encoding.
+
+    ``default`` encodes unsupported objects as in ``json_codec.dumps``. Values
+    that cannot be encoded at all are hashed through ``str(value)``.
+    """
+
+    return hashlib.blake2b(_encode(value, default), digest_size=DIGEST_SIZE).hexdigest()
+
+
+class JsonSequenceDigest:
+    """Chained digest of a sequence of JSON values, extended one value at a time.
+
+    Each step hashes the previous digest with the next value's length-prefixed
+    encoding, so ``[a, b]`` and ``[a + b]`` never collide and a digest stored
+    in state can be extended later from ``start`` without the earlier values.
+    """
+
+    def __init__(self, default=None, start: str | None = None):
+        self._default = default
+        self._digest = bytes.fromhex(start) if start else b""
+
+    def update(self, value) -> None:
+        data = _encode(value, self._default)
+        step = hashlib.blake2b(self._digest, digest_size=DIGEST_SIZE)
+        step.update(len(data).to_bytes(8, "little"))
+        step.update(data)
+        self._digest = step.digest()
+
+    def hexdigest(self) -> str:
+        return self._digest.hex()
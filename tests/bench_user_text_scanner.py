@@ -0,0 +1,62 @@
+"""Time the linear User:/Assistant: scanner against the regex it replaced.
+
+Usage: python tests/bench_user_text_scanner.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from session_events import extract_user_lines_from_conversation_text, should_ignore_user_text
+from test_user_text_scanner import regex_should_ignore, regex_user_lines
+
+
+CASES = {
+    "300KB code paste": "User:\n" + ("def f(x):\n    return x  # comment\n" * 8500),
+    "transcript 2k turns": "".join(
+        "User:\nquestion %d\nAssistant:\nanswer %d\n" % (turn, turn) for turn in range(2000)
+    ),
+    "whitespace run 20K": "User:\nx" + " " * 20000 + "y",
+    "whitespace run 40K": "User:\nx" + " " * 40000 + "y",
+    "indented paste 200KB": "User:\n" + ("        " * 6 + "value\n") * 3800,
+    "no header 300KB": "plain text line\n" * 19000,
+}
+
+
+def best_ms(func, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> None:
+    for name, text in CASES.items():
+        if regex_user_lines(text) != extract_user_lines_from_conversation_text(text):
+            raise SystemExit(f"{name}: scanner and regex disagree")
+        slow = "whitespace" in name
+        print(
+            "%-22s regex %9.2f ms   scanner %7.2f ms"
+            % (
+                name,
+                best_ms(regex_user_lines, text, 1 if slow else 3),
+                best_ms(extract_user_lines_from_conversation_text, text, 3),
+            )
+        )
+    text = "   \n" + "x" * 300000
+    print(
+        "%-22s strip %10.3f ms   scanner %7.3f ms"
+        % (
+            "ignore check 300KB",
+            best_ms(regex_should_ignore, text, 20),
+            best_ms(should_ignore_user_text, text, 20),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """A fakeredis client; ``redis.Redis.from_url`` returns clients of the same server."""
+
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.Redis,
+        "from_url",
+        staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)),
+    )
+    return fakeredis.FakeRedis(server=server)
+
+
+@pytest.fixture(params=["orjson", "json"])
+def codec_backend(request, monkeypatch):
+    """Run the test once per ``json_codec`` backend; orjson is skipped if missing."""
+
+    import json_codec
+
+    if request.param == "orjson":
+        if json_codec.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(json_codec, "orjson", None)
+    return request.param
+
+
+@pytest.fixture
+def redis_config(tmp_path, monkeypatch):
+    """Build a puller config exporting under ``tmp_path``; keyword args are env overrides."""
+
+    def build(**env) -> dict:
+        from config import load_redis_config
+
+        for name in list(__import__("os").environ):
+            if name.startswith(("SHARD_", "STATE_", "OUTPUT_", "SIDECAR_", "BLOB_", "DEST_")):
+                monkeypatch.delenv(name)
+        monkeypatch.setenv("REDIS_URL", "redis://localhost:6379/0")
+        monkeypatch.setenv("EXPORT_ROOT", str(tmp_path / "export"))
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return load_redis_config()
+
+    return build
+
+
+def add_session(r, session_id: str, seqs: int, start: int = 1) -> None:
+    """Store ``seqs`` Claude request/response pairs for ``session_id`` in Redis."""
+
+    import json
+
+    r.hset(
+        f"session:{session_id}:info",
+        mapping={"userName": "alice", "model": "claude-x", "apiType": "claude"},
+    )
+    r.hset(f"session:{session_id}:usage", mapping={"inputTokens": "10", "outputTokens": "3"})
+    messages = []
+    for seq in range(1, start + seqs):
+        messages.append({"role": "user", "content": f"question {seq} for {session_id}"})
+        if seq < start:
+            continue
+        r.set(f"session:{session_id}:req:{seq}:messages", json.dumps(messages))
+        r.set(
+            f"session:{session_id}:req:{seq}:requestBody",
+            json.dumps({"model": "claude-x", "messages": messages}),
+        )
+        r.set(
+            f"session:{session_id}:req:{seq}:response",
+            'data: {"type":"content_block_delta","index":0,'
+            '"delta":{"type":"text_delta","text":"answer %d"}}\n\n' % seq,
+        )
+        r.set(f"session:{session_id}:req:{seq}:reqHeaders", json.dumps({"user-agent": "cli"}))
+    r.set(f"session:{session_id}:seq", start + seqs - 1)
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+import blob_store
+
+
+def test_failed_write_is_not_remembered(tmp_path, monkeypatch):
+    data = b'{"messages": []}'
+    replace = os.replace
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(blob_store.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        blob_store.store_blob(str(tmp_path), data)
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
+
+    monkeypatch.setattr(blob_store.os, "replace", replace)
+    ref = blob_store.store_blob(str(tmp_path), data)
+    assert blob_store.load_blob(str(tmp_path), ref) == data
+
+
+def test_known_blob_is_per_directory(tmp_path):
+    data = b"shared payload"
+    first = blob_store.store_blob(str(tmp_path / "a"), data)
+    second = blob_store.store_blob(str(tmp_path / "b"), data)
+    assert first == second
+    assert blob_store.load_blob(str(tmp_path / "b"), second) == data
@@ -0,0 +1,43 @@
+import gzip
+import itertools
+
+import puller
+from conftest import add_session
+
+
+def _export_idle_sessions(fake_redis, redis_config, count: int, **env):
+    config = redis_config(COMPACT_IDLE_SECONDS=60, **env)
+    for index in range(count):
+        add_session(fake_redis, f"s{index}", 1)
+    store, state = puller._open_state(config)
+    writer = puller.open_jsonl_writer(config)
+    puller.poll(fake_redis, store, state, config, writer=writer)
+    writer.close()
+    store.close()
+    return config, state
+
+
+def test_idle_sessions_are_compacted_in_place(fake_redis, redis_config):
+    config, state = _export_idle_sessions(fake_redis, redis_config, 2)
+    path = puller.build_session_file_path(config["dest_dir"], "s0")
+    plain = path.read_bytes()
+
+    now_ts = state["sessions"]["s0"]["last_activity_at"] + 61
+    assert puller.compact_idle_sessions(state, config, now_ts) == {"s0", "s1"}
+    assert not path.exists()
+    assert gzip.decompress(path.with_name(path.name + ".gz").read_bytes()) == plain
+
+
+def test_time_budget_stops_after_the_first_session(fake_redis, redis_config, monkeypatch):
+    config, state = _export_idle_sessions(fake_redis, redis_config, 3, COMPACT_TIME_BUDGET_MS=50)
+    now_ts = max(entry["last_activity_at"] for entry in state["sessions"].values()) + 61
+    # Every monotonic() call advances one second: the budget is spent at once.
+    ticks = itertools.count(step=1.0)
+    monkeypatch.setattr(puller.time, "monotonic", lambda: next(ticks))
+
+    assert len(puller.compact_idle_sessions(state, config, now_ts)) == 1
+    assert len(puller.compact_idle_sessions(state, config, now_ts)) == 1
+
+    monkeypatch.setitem(config, "compact_time_budget_ms", 0)
+    assert len(puller.compact_idle_sessions(state, config, now_ts)) == 1
+    assert all("compacted_at" in entry for entry in state["sessions"].values())
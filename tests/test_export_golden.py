@@ -0,0 +1,117 @@
+"""End-to-end export compared against output recorded before the orjson codec.
+
+tests/fixtures/golden_export/ holds the files the stdlib-only exporter wrote
+for ``populate_golden_sessions``; only the ``at`` timestamps are masked. That
+exporter re-walked the full message history on every request, hence
+``INCREMENTAL_MESSAGES=0``.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+
+import pytest
+
+import puller
+
+
+GOLDEN_DIR = Path(__file__).parent / "fixtures" / "golden_export"
+AT_RE = re.compile(r'"at":"[^"]*"')
+
+# Kept apart: a >64-bit integer sends the whole record through the stdlib
+# encoder, which would hide float differences in the same record.
+FLOAT_VALUES = {
+    "zeta": "last key first",
+    "floats": [0.1, 1e16, 1e-05, 1.5e300, -0.0, 123456789.125, 1e22, 5e-324, 2.5e-7],
+    "text": "café ☕ 日本語   \"quoted\" \\ tab\t",
+    "emoji": "\U0001f600",
+    "nested": {"b": [1, {"y": None, "x": True}], "a": {}},
+    "alpha": [],
+}
+INT_VALUES = {"zeta": 2**63 - 1, "ints": [0, -1, 2**64, -(2**70), 10**30], "alpha": "ü"}
+
+
+def populate_golden_sessions(r) -> None:
+    for index, session_id in enumerate(("golden-a", "golden-ü")):
+        r.hset(
+            f"session:{session_id}:info",
+            mapping={"userName": "zoë", "model": "claude-x", "apiType": "claude"},
+        )
+        r.hset(f"session:{session_id}:usage", mapping={"cost": "0.00001", "tokens": str(index)})
+        messages = []
+        for seq in range(1, 4):
+            messages.append({"role": "user", "content": f"question {seq} — {session_id}"})
+            messages.append(
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "tool_result", "tool_use_id": f"t{seq}", "content": FLOAT_VALUES},
+                    ],
+                }
+            )
+            body = {"model": "claude-x", "metadata": FLOAT_VALUES, "messages": messages}
+            r.set(f"session:{session_id}:req:{seq}:messages", json.dumps(messages))
+            r.set(f"session:{session_id}:req:{seq}:requestBody", json.dumps(body, ensure_ascii=False))
+            r.set(
+                f"session:{session_id}:req:{seq}:response",
+                'data: {"type":"content_block_delta","index":0,'
+                '"delta":{"type":"text_delta","text":"réponse %d "}}\n\n'
+                'data: {"type":"content_block_start","index":1,"content_block":'
+                '{"type":"tool_use","id":"t%d","name":"bash","input":{}}}\n\n'
+                'data: {"type":"content_block_delta","index":1,"delta":'
+                '{"type":"input_json_delta","partial_json":"{\\"n\\":1e16,\\"s\\":\\"ü\\"}"}}\n\n'
+                % (seq, seq),
+            )
+            r.set(f"session:{session_id}:req:{seq}:reqHeaders", json.dumps({"z": "1", "a": "ü"}))
+            r.set(
+                f"session:{session_id}:req:{seq}:upstreamResMeta",
+                json.dumps({"status": 200, "latency": 1e-05, "bytes": 1.5e9}),
+            )
+            r.set(f"session:{session_id}:req:{seq}:clientReqMeta", json.dumps(INT_VALUES))
+            r.set(f"session:{session_id}:req:{seq}:specialSettings", json.dumps([INT_VALUES]))
+        r.set(f"session:{session_id}:seq", 3)
+
+
+def read_export(root: Path) -> dict[str, str]:
+    files = {}
+    for path in sorted(root.rglob("*")):
+        # Session and sidecar files only; not the .layout.json marker.
+        if path.is_file() and path.suffix == ".json" and not path.name.startswith("."):
+            text = path.read_text(encoding="utf-8")
+            files[path.relative_to(root).as_posix()] = AT_RE.sub('"at":""', text)
+    return files
+
+
+def test_export_matches_stdlib_golden_output(fake_redis, redis_config, codec_backend):
+    populate_golden_sessions(fake_redis)
+    config = redis_config(INCREMENTAL_MESSAGES=0)
+    puller.run_once(config)
+
+    root = Path(config["export_root"]) / "redis"
+    expected = {
+        path.relative_to(GOLDEN_DIR).as_posix(): path.read_text(encoding="utf-8")
+        for path in sorted(GOLDEN_DIR.rglob("*.json"))
+    }
+    assert expected
+    assert read_export(root) == expected
+
+
+if __name__ == "__main__":
+    # Regenerate the fixtures with a stdlib-only exporter first on the path:
+    #   EXPORT_ROOT=$(mktemp -d) PYTHONPATH=<exporter src> python tests/test_export_golden.py
+    import fakeredis
+    import redis
+
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    populate_golden_sessions(fakeredis.FakeRedis(server=server))
+    os.environ.update(REDIS_URL="redis://localhost:6379/0")
+    from config import load_redis_config
+
+    config = load_redis_config()
+    puller.run_once(config)
+    for name, text in read_export(Path(config["export_root"]) / "redis").items():
+        target = GOLDEN_DIR / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text, encoding="utf-8")
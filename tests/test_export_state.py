@@ -0,0 +1,49 @@
+import os
+
+import export_state
+from export_state import JournalStateStore
+
+
+DEFAULT = {"version": 1, "sessions": {}}
+
+
+def _save(store: JournalStateStore, state: dict, **entries) -> None:
+    state["sessions"].update(entries)
+    store.mark_dirty("sessions", entries)
+    store.save(state)
+
+
+def test_torn_journal_tail_does_not_swallow_next_save(tmp_path):
+    path = str(tmp_path / "state.json")
+    store = JournalStateStore(path, DEFAULT)
+    state = store.load()
+    _save(store, state, a={"cursor_seq": 1})  # first save writes the snapshot
+    _save(store, state, b={"cursor_seq": 1})
+
+    # A crash in the middle of the next append.
+    with open(store.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"s":"sessions","k":"c","v":{"cursor')
+
+    store = JournalStateStore(path, DEFAULT)
+    state = store.load()
+    assert set(state["sessions"]) == {"a", "b"}
+    _save(store, state, d={"cursor_seq": 2}, e={"cursor_seq": 3})
+
+    loaded = JournalStateStore(path, DEFAULT).load()
+    assert loaded["sessions"] == {
+        "a": {"cursor_seq": 1},
+        "b": {"cursor_seq": 1},
+        "d": {"cursor_seq": 2},
+        "e": {"cursor_seq": 3},
+    }
+
+
+def test_fsync_covers_journal_appends(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(export_state.os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+    store = JournalStateStore(str(tmp_path / "state.json"), DEFAULT, fsync=True)
+    state = store.load()
+    _save(store, state, a={"cursor_seq": 1})
+    _save(store, state, b={"cursor_seq": 1})
+    assert len(synced) == 2
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import puller
+from conftest import add_session
+
+
+@pytest.fixture
+def mget_calls(fake_redis, monkeypatch):
+    calls = []
+    mget = type(fake_redis).mget
+
+    def recording_mget(self, keys, *args):
+        values = mget(self, keys, *args)
+        size = sum(len(value) for value in values if value is not None)
+        calls.append((len(keys) // len(puller._build_seq_record_keys("s", 1)), size))
+        return values
+
+    monkeypatch.setattr(type(fake_redis), "mget", recording_mget)
+    return calls
+
+
+def test_large_body_never_shares_an_oversized_mget(fake_redis, redis_config, mget_calls):
+    add_session(fake_redis, "s", 8)
+    fake_redis.set("session:s:req:3:requestBody", json.dumps({"pad": "x" * 5000}))
+    config = redis_config(FETCH_MAX_BYTES=2000, FETCH_MAX_SEQS=100)
+    puller.run_once(config)
+
+    assert sum(seqs for seqs, _ in mget_calls) == 8
+    for seqs, size in mget_calls:
+        assert seqs == 1 or size <= 2000
+
+
+def test_first_window_uses_stored_average(fake_redis, redis_config, mget_calls):
+    add_session(fake_redis, "s", 2)
+    config = redis_config(FETCH_MAX_BYTES=100000, FETCH_MAX_SEQS=100)
+    puller.run_once(config)
+    mget_calls.clear()
+
+    add_session(fake_redis, "s", 5, start=3)
+    puller.run_once(config)
+    assert [seqs for seqs, _ in mget_calls] == [5]
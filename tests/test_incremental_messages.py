@@ -0,0 +1,100 @@
+import json
+
+import json_codec
+import puller
+from signatures import JsonSequenceDigest
+
+
+def _message(text: str) -> dict:
+    return {"role": "user", "content": text}
+
+
+def _raw(messages: list, **kwargs) -> bytes:
+    return json.dumps(messages, **kwargs).encode("utf-8")
+
+
+def _advance(entry: dict, messages: list, **kwargs) -> int:
+    offset, tail = puller._load_new_messages(entry, _raw(messages, **kwargs))
+    assert tail == messages[offset:]
+    return offset
+
+
+def test_appended_messages_continue_after_prefix():
+    entry: dict = {}
+    history = [_message("one"), _message("two")]
+    assert _advance(entry, history) == 0
+
+    history.append(_message("three"))
+    assert _advance(entry, history) == 2
+    assert _advance(entry, history + [_message("four")]) == 3
+    assert entry["messages_seen"] == 4
+    assert _advance(entry, history + [_message("four")]) == 4
+
+
+def test_appended_messages_parse_only_the_tail(monkeypatch):
+    entry: dict = {}
+    history = [_message("x" * 1000) for _ in range(50)]
+    _advance(entry, history)
+
+    parsed = []
+    loads = json_codec.loads
+    monkeypatch.setattr(json_codec, "loads", lambda data: parsed.append(len(data)) or loads(data))
+    assert _advance(entry, history + [_message("new")]) == 50
+    assert parsed and max(parsed) < 100
+
+
+def test_tail_digest_matches_full_walk():
+    history = [_message(text) for text in ("one", "two", "three")]
+    stepwise: dict = {}
+    for end in range(1, len(history) + 1):
+        _advance(stepwise, history[:end])
+    full: dict = {}
+    _advance(full, history)
+    assert stepwise == full
+
+
+def test_reserialized_history_still_matches_prefix():
+    entry: dict = {}
+    history = [_message("one"), _message("two")]
+    _advance(entry, history)
+    # Same messages, different separators: the raw bytes no longer match.
+    assert _advance(entry, history + [_message("three")], separators=(",", ":")) == 2
+    assert _advance(entry, history + [_message("three"), _message("four")], separators=(",", ":")) == 3
+
+
+def test_edit_anywhere_in_prefix_forces_full_walk():
+    history = [_message(text) for text in ("one", "two", "three", "four")]
+    for index in range(len(history)):
+        entry: dict = {}
+        _advance(entry, history)
+        edited = [dict(message) for message in history] + [_message("five")]
+        edited[index]["content"] = "edited"
+        assert _advance(entry, edited) == 0
+        # The walk re-anchors on the edited history.
+        assert _advance(entry, edited + [_message("six")]) == 5
+
+
+def test_shorter_history_forces_full_walk():
+    entry: dict = {}
+    _advance(entry, [_message("one"), _message("two")])
+    assert _advance(entry, [_message("summary")]) == 0
+
+
+def test_sequence_digest_separates_values():
+    joined = JsonSequenceDigest()
+    joined.update("ab")
+    split = JsonSequenceDigest()
+    split.update("a")
+    split.update("b")
+    assert joined.hexdigest() != split.hexdigest()
+
+    again = JsonSequenceDigest()
+    again.update("a")
+    again.update("b")
+    assert again.hexdigest() == split.hexdigest()
+
+    first = JsonSequenceDigest()
+    first.update("a")
+    resumed = JsonSequenceDigest(start=first.hexdigest())
+    resumed.update("b")
+    assert resumed.hexdigest() == split.hexdigest()
@@ -0,0 +1,92 @@
+import json
+import random
+
+import pytest
+
+import json_codec
+
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+
+def stdlib_dumps(value, sort_keys=False) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys)
+
+
+FLOATS = [
+    0.0, -0.0, 0.1, 1.5, -2.25, 1e15, 1e16, 1e-4, 1e-05, 1e-7, 2.5e-7, 1e22, 1e300,
+    -1.5e300, 5e-324, 1.7976931348623157e308, 123456789.125, 0.30000000000000004,
+]
+INTS = [0, -1, 2**31, 2**53 + 1, 2**63 - 1, -(2**63), 2**63, 2**64, -(2**64) - 1, 10**30]
+STRINGS = [
+    "", "plain", "café", "日本語", "\U0001f600", "tab\tnewline\nquote\"back\\slash",
+    "\x00\x1f\x7f", "  ", "</script>", "1e16", "0.00001",
+]
+
+
+@pytest.mark.parametrize("value", FLOATS + [[value] for value in FLOATS])
+def test_floats_match_stdlib(value):
+    assert json_codec.dumps(value) == stdlib_dumps(value)
+    assert json_codec.dumps({"n": value, "s": "0.00001 1e16"}) == stdlib_dumps(
+        {"n": value, "s": "0.00001 1e16"}
+    )
+
+
+@pytest.mark.parametrize("value", INTS)
+def test_big_ints_match_stdlib(value):
+    text = stdlib_dumps({"n": value, "m": [value, 1.5]})
+    assert json_codec.dumps({"n": value, "m": [value, 1.5]}) == text
+    decoded = json_codec.loads(text)
+    assert decoded == json.loads(text)
+    assert type(decoded["n"]) is int
+
+
+@pytest.mark.parametrize("value", STRINGS)
+def test_strings_are_not_ascii_escaped(value):
+    assert json_codec.dumps({value: value}) == stdlib_dumps({value: value})
+    assert json_codec.dumps_bytes([value]) == stdlib_dumps([value]).encode("utf-8")
+
+
+def test_key_order():
+    value = {"b": 1, "a": {"d": [3, {"z": 0, "y": 1}], "c": 2}, "é": 3, "A": 4, "_": 5}
+    assert json_codec.dumps(value) == stdlib_dumps(value)
+    assert json_codec.dumps(value, sort_keys=True) == stdlib_dumps(value, sort_keys=True)
+
+
+def test_loads_matches_stdlib_for_floats():
+    for value in FLOATS:
+        text = stdlib_dumps([value])
+        decoded = json_codec.loads(text)
+        assert decoded == json.loads(text)
+        assert type(decoded[0]) is float
+
+
+def _random_value(rng: random.Random, depth: int = 0):
+    kinds = ["float", "int", "str", "bool", "null"] + (["list", "dict"] if depth < 3 else [])
+    kind = rng.choice(kinds)
+    if kind == "float":
+        return rng.choice(FLOATS) * rng.choice([1, -1]) + rng.choice([0, 0.5, 1e-9])
+    if kind == "int":
+        return rng.choice(INTS + [rng.randint(-(10**25), 10**25)])
+    if kind == "str":
+        return "".join(rng.choice(STRINGS) for _ in range(rng.randint(0, 3)))
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    if kind == "list":
+        return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {
+        rng.choice(STRINGS) + str(index): _random_value(rng, depth + 1)
+        for index in range(rng.randint(0, 4))
+    }
+
+
+def test_random_documents_match_stdlib():
+    rng = random.Random(15)
+    for _ in range(2000):
+        value = _random_value(rng)
+        for sort_keys in (False, True):
+            text = stdlib_dumps(value, sort_keys=sort_keys)
+            assert json_codec.dumps(value, sort_keys=sort_keys) == text
+            assert json_codec.dumps(json_codec.loads(text), sort_keys=sort_keys) == text
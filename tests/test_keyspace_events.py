@@ -0,0 +1,126 @@
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+
+import puller
+
+
+def _collect(pubsub, expected: int, timeout: float = 5.0) -> set[str]:
+    touched: set[str] = set()
+    deadline = time.time() + timeout
+    while len(touched) < expected and time.time() < deadline:
+        touched |= puller._collect_touched_sessions(pubsub, timeout=0.5, debounce=0.05)
+    return touched
+
+
+def test_session_id_from_key():
+    assert puller._session_id_from_key("session:a:seq") == "a"
+    assert puller._session_id_from_key("session:a:b:req:3:response") == "a:b"
+    assert puller._session_id_from_key("session:a:req:3:messages") is None
+    assert puller._session_id_from_key("session::seq") is None
+    assert puller._session_id_from_key("other:a:seq") is None
+
+
+def test_collect_touched_sessions_from_keyspace_messages(fake_redis):
+    pubsub = puller._subscribe_keyspace_events(fake_redis)
+    try:
+        fake_redis.publish("__keyspace@0__:session:a:seq", "set")
+        fake_redis.publish("__keyspace@0__:session:b:req:7:response", "set")
+        fake_redis.publish("__keyspace@0__:session:c:req:7:messages", "set")
+        fake_redis.publish("__keyspace@1__:session:d:seq", "set")
+        assert _collect(pubsub, 2) == {"a", "b"}
+    finally:
+        pubsub.close()
+
+
+def test_collect_touched_sessions_times_out_without_messages(fake_redis):
+    pubsub = puller._subscribe_keyspace_events(fake_redis)
+    try:
+        started = time.time()
+        assert puller._collect_touched_sessions(pubsub, timeout=0.2, debounce=0.05) == set()
+        assert time.time() - started < 2
+    finally:
+        pubsub.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def redis_server():
+    binary = shutil.which("redis-server")
+    if binary is None:
+        pytest.skip("redis-server is not installed")
+    redis = pytest.importorskip("redis")
+    port = _free_port()
+    process = subprocess.Popen(
+        [binary, "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    client = redis.Redis(port=port)
+    try:
+        for _ in range(100):
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.05)
+        else:
+            pytest.fail("redis-server did not start")
+        yield client
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def test_keyspace_events_from_real_redis_server(redis_server):
+    redis_server.config_set("notify-keyspace-events", "")
+    puller._enable_keyspace_events(redis_server)
+    flags = redis_server.config_get("notify-keyspace-events")["notify-keyspace-events"]
+    assert "K" in flags and ("$" in flags or "A" in flags)
+
+    pubsub = puller._subscribe_keyspace_events(redis_server)
+    try:
+        # Let the subscription register before writing.
+        pubsub.get_message(timeout=0.5)
+        redis_server.set("session:a:seq", 3)
+        redis_server.set("session:b:req:3:response", "data: {}\n\n")
+        redis_server.set("session:c:req:3:messages", "[]")
+        assert _collect(pubsub, 2) == {"a", "b"}
+    finally:
+        pubsub.close()
+
+
+def test_keyspace_poll_exports_only_touched_sessions(fake_redis, redis_config):
+    from conftest import add_session
+
+    add_session(fake_redis, "a", 2)
+    add_session(fake_redis, "b", 2)
+    config = redis_config()
+    puller._prepare_output_dirs(config)
+    store = puller._open_state_store(config)
+    state = store.load()
+    writer = puller.open_jsonl_writer(config)
+    pubsub = puller._subscribe_keyspace_events(fake_redis)
+    try:
+        fake_redis.publish("__keyspace@0__:session:a:seq", "set")
+        touched = _collect(pubsub, 1)
+        puller.poll(fake_redis, store, state, config, sorted(touched), writer)
+        writer.flush()
+    finally:
+        pubsub.close()
+        writer.close()
+        store.close()
+
+    assert touched == {"a"}
+    assert set(state["sessions"]) == {"a"}
+    assert state["sessions"]["a"]["cursor_seq"] == 2
+    assert puller.build_session_file_path(config["dest_dir"], "a").exists()
+    assert not puller.build_session_file_path(config["dest_dir"], "b").exists()
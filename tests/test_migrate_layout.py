@@ -0,0 +1,43 @@
+import pytest
+
+from migrate_layout import SESSION_FILE_RE, migrate_layout
+from output_writer import HASHED_LAYOUT, build_layout_relative_path
+
+
+@pytest.mark.parametrize(
+    "name, safe_id, suffix",
+    [
+        ("abc.json", "abc", ".json"),
+        ("abc.json.idx", "abc", ".json.idx"),
+        ("abc.json.gz", "abc", ".json.gz"),
+        ("abc.json.gz.frames", "abc", ".json.gz.frames"),
+        ("abc.json.v2.json.gz", "abc.json.v2", ".json.gz"),
+        ("abc.json.idx.json", "abc.json.idx", ".json"),
+    ],
+)
+def test_session_file_names_split_on_known_suffixes(name, safe_id, suffix):
+    match = SESSION_FILE_RE.match(name)
+    assert match and (match.group("safe_id"), match.group("suffix")) == (safe_id, suffix)
+
+
+@pytest.mark.parametrize("name", ["abc.json.bak", "abc.txt", ".json"])
+def test_other_files_are_not_session_files(name):
+    assert SESSION_FILE_RE.match(name) is None
+
+
+def test_round_trip_keeps_ids_containing_json(tmp_path):
+    names = ["abc.json.v2.json", "abc.json.v2.json.gz", "abc.json.v2.json.gz.frames", "plain.json"]
+    for name in names:
+        (tmp_path / name).write_text(name, encoding="utf-8")
+
+    assert migrate_layout(str(tmp_path), "hashed") == len(names)
+    for name in names:
+        safe_id, suffix = SESSION_FILE_RE.match(name).groups()
+        target = tmp_path / build_layout_relative_path(HASHED_LAYOUT, safe_id, suffix)
+        assert target.read_text(encoding="utf-8") == name
+    # Files of one session share a directory.
+    assert len({path.parent for path in tmp_path.rglob("abc.json.v2*")}) == 1
+
+    assert migrate_layout(str(tmp_path), "flat") == len(names)
+    moved = sorted(path.name for path in tmp_path.iterdir() if path.name != ".layout.json")
+    assert moved == sorted(names)
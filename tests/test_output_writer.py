@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from output_writer import as_raw_json, encode_jsonl_record
+
+
+@pytest.mark.parametrize(
+    "value",
+    ['{not json}', '{"a":1}\n{"b":2}', '[1,2', '{"a":1}}', b'{"a":"\xff"}', "[]x]"],
+)
+def test_invalid_json_is_not_passed_through(value):
+    assert as_raw_json(value) is None
+
+
+def test_array_requires_opt_in():
+    assert as_raw_json("[1, 2]").text == "[1, 2]"
+    assert as_raw_json("[1, 2]", require_object=True) is None
+
+
+def test_raw_json_is_embedded_on_one_line():
+    raw = as_raw_json(b'{\r\n  "text": "caf\xc3\xa9",\n  "n": [1, 2]\n}\n')
+    line = encode_jsonl_record({"payload": raw, "seq": 1})
+    assert "\n" not in line
+    assert json.loads(line) == {"payload": {"text": "café", "n": [1, 2]}, "seq": 1}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        b'{"a": NaN, "b": [Infinity, -Infinity, 1.5]}',
+        '[{"x": -Infinity}]',
+        b'{"n": 123456789012345678901234567890, "f": NaN}',
+    ],
+)
+def test_non_finite_constants_match_codec_path(value):
+    import puller
+
+    records = {"request_body": value, "client_request_meta": value}
+    raw = puller._extract_sidecar_events(records, 1, {"raw_json": True})
+    parsed = puller._extract_sidecar_events(records, 1, {"raw_json": False})
+    raw_lines = [encode_jsonl_record(event["payload"]) for event in raw]
+    parsed_lines = [encode_jsonl_record(event["payload"]) for event in parsed]
+    assert raw_lines == parsed_lines
+    assert "NaN" not in "".join(raw_lines) and "Infinity" not in "".join(raw_lines)
+    assert as_raw_json(value) is None
@@ -0,0 +1,67 @@
+"""Golden SSE responses, one or more per protocol.
+
+Each tests/fixtures/sse/<name>.sse has a <name>.expected.json holding the
+answer text, tool uses and raw tool events of the original extractor, which
+made a separate pass over the events for every protocol, before the
+streaming parser, single-pass visitors and protocol hints. ``unknown_*``
+streams identify no protocol, so every visitor runs on them.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from session_events import extract_response_artifacts_from_response_text
+
+
+SSE_DIR = Path(__file__).parent / "fixtures" / "sse"
+FIXTURES = sorted(path.stem for path in SSE_DIR.glob("*.sse"))
+PROTOCOLS = {
+    "claude": "claude",
+    "openai": "openai",
+    "responses": "response",
+    "gemini": "gemini",
+    "unknown": None,
+}
+
+
+def _artifacts(answer, tool_uses, raw_events) -> dict:
+    return {"answer": answer, "toolUses": tool_uses, "rawEvents": raw_events}
+
+
+def _load(name: str) -> tuple[str, dict]:
+    text = (SSE_DIR / f"{name}.sse").read_text(encoding="utf-8")
+    expected = json.loads((SSE_DIR / f"{name}.expected.json").read_text(encoding="utf-8"))
+    return text, expected
+
+
+def test_every_protocol_has_a_fixture():
+    assert {name.split("_", 1)[0] for name in FIXTURES} == set(PROTOCOLS)
+
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_artifacts_match_golden(name):
+    from session_events import extract_response_artifacts
+
+    text, expected = _load(name)
+    assert _artifacts(*extract_response_artifacts_from_response_text(text)) == expected
+
+    answer, tool_uses, raw_events, protocol = extract_response_artifacts(text)
+    assert protocol == PROTOCOLS[name.split("_", 1)[0]]
+    assert _artifacts(answer, tool_uses, raw_events) == expected
+    # The session's remembered protocol and raw Redis bytes take other paths.
+    assert _artifacts(*extract_response_artifacts(text, protocol)[:3]) == expected
+    assert _artifacts(*extract_response_artifacts(text.encode("utf-8"))[:3]) == expected
+    assert _artifacts(*extract_response_artifacts(text.replace("\n", "\r\n"))[:3]) == expected
+
+
+if __name__ == "__main__":
+    # Regenerate expectations with a reference extractor first on PYTHONPATH.
+    for name in FIXTURES:
+        text = (SSE_DIR / f"{name}.sse").read_text(encoding="utf-8")
+        expected = _artifacts(*extract_response_artifacts_from_response_text(text))
+        (SSE_DIR / f"{name}.expected.json").write_text(
+            json.dumps(expected, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
@@ -0,0 +1,184 @@
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import puller
+from config import build_shard_config
+from conftest import add_session
+
+
+SESSION_IDS = [f"s{index}" for index in range(8)]
+
+
+def _run(config: dict, shard_count: int) -> None:
+    if shard_count == 1:
+        puller.run_once(config)
+        return
+    config = {**config, "shard_count": shard_count}
+    for shard_index in range(shard_count):
+        puller.run_once(build_shard_config(config, shard_index))
+
+
+def _exported_turns(config: dict, session_id: str) -> list[tuple]:
+    path = puller.build_session_file_path(config["dest_dir"], session_id)
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    return [
+        (record["type"], record["requestSequence"])
+        for record in records
+        if record["type"] in ("user_input", "llm_answer")
+    ]
+
+
+@pytest.mark.parametrize("backend", ["json", "journal", "sqlite"])
+def test_changing_shard_count_keeps_cursors(fake_redis, redis_config, backend):
+    config = redis_config(STATE_BACKEND=backend)
+    for session_id in SESSION_IDS:
+        add_session(fake_redis, session_id, 2)
+    _run(config, 1)
+
+    for start, shard_count in ((3, 3), (5, 2), (7, 1)):
+        for session_id in SESSION_IDS:
+            add_session(fake_redis, session_id, 2, start=start)
+        _run(config, shard_count)
+
+    for session_id in SESSION_IDS:
+        assert _exported_turns(config, session_id) == [
+            (event_type, seq)
+            for seq in range(1, 9)
+            for event_type in ("user_input", "llm_answer")
+        ]
+
+
+def test_new_shard_takes_only_owned_sessions(fake_redis, redis_config):
+    config = redis_config()
+    for session_id in SESSION_IDS:
+        add_session(fake_redis, session_id, 1)
+    _run(config, 1)
+
+    shard = build_shard_config({**config, "shard_count": 2}, 1)
+    store, state = puller._open_state(shard)
+    store.close()
+
+    owned = {
+        session_id
+        for session_id in SESSION_IDS
+        if puller.session_shard(session_id, 2) == 1
+    }
+    assert set(state["sessions"]) == owned
+    assert all(state["sessions"][session_id]["cursor_seq"] == 1 for session_id in owned)
+
+
+def test_malformed_foreign_entries_are_skipped(redis_config):
+    config = redis_config()
+    state_path = Path(config["state_path"])
+    state_path.parent.mkdir(parents=True)
+    owned = next(s for s in SESSION_IDS if puller.session_shard(s, 2) == 0)
+    state_path.write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "sessions": {
+                    owned: {"cursor_seq": "7", "last_msg_seq": 3},
+                    **{s: "junk" for s in SESSION_IDS if s != owned},
+                },
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    store, state = puller._open_state(build_shard_config({**config, "shard_count": 2}, 0))
+    store.close()
+    assert state["sessions"] == {owned: {"cursor_seq": "7", "last_msg_seq": 3}}
+
+
+def test_probing_layouts_creates_no_sqlite_files(redis_config):
+    config = redis_config(STATE_BACKEND="sqlite")
+    state_dir = Path(config["state_path"]).parent
+    state_dir.mkdir(parents=True)
+    # A JSON snapshot the sqlite store has not imported yet, plus stray files
+    # of another layout that never wrote a database.
+    Path(config["state_path"]).write_text(
+        json.dumps({"version": 1, "sessions": {s: {"cursor_seq": 2} for s in SESSION_IDS}}),
+        encoding="utf-8",
+    )
+    (state_dir / "redis_puller.shard-1-of-3.json.tmp").write_text("", encoding="utf-8")
+
+    shard = build_shard_config({**config, "shard_count": 2}, 0)
+    store, state = puller._open_state(shard)
+    store.close()
+
+    assert state["sessions"]
+    assert sorted(path.name for path in state_dir.glob("*.sqlite3")) == [
+        "redis_puller.shard-0-of-2.sqlite3"
+    ]
+
+
+SUPERVISOR_SCRIPT = """
+import os, sys, time
+sys.path.insert(0, {src!r})
+import puller
+
+def fake_shard(config, once):
+    path = os.path.join({tmp!r}, "worker-%d" % config["shard_index"])
+    with open(path + ".tmp", "w") as f:
+        f.write(str(os.getpid()))
+    os.replace(path + ".tmp", path)
+    time.sleep(60)
+
+puller._run_shard = fake_shard
+puller.run_supervisor(
+    {{"shard_count": 2, "state_path": {state!r}, "state_archive_path": None}}, False
+)
+"""
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork", reason="needs fork to patch workers"
+)
+def test_supervisor_sigterm_stops_workers(tmp_path):
+    script = SUPERVISOR_SCRIPT.format(
+        src=str(Path(puller.__file__).parent),
+        tmp=str(tmp_path),
+        state=str(tmp_path / "state.json"),
+    )
+    supervisor = subprocess.Popen([sys.executable, "-c", script])
+    try:
+        deadline = time.time() + 10
+        pid_files = [tmp_path / "worker-0", tmp_path / "worker-1"]
+        while not all(path.exists() for path in pid_files):
+            assert time.time() < deadline, "workers did not start"
+            time.sleep(0.05)
+        worker_pids = [int(path.read_text()) for path in pid_files]
+
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(timeout=10) == 0
+        for pid in worker_pids:
+            deadline = time.time() + 5
+            while _alive(pid):
+                assert time.time() < deadline, f"worker {pid} survived the supervisor"
+                time.sleep(0.05)
+    finally:
+        supervisor.kill()
+        supervisor.wait()
+        for path in tmp_path.glob("worker-*"):
+            if path.suffix != ".tmp" and _alive(int(path.read_text())):
+                os.kill(int(path.read_text()), signal.SIGKILL)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            return f.read().split()[2] != "Z"
+    except OSError:
+        return True
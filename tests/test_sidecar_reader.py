@@ -0,0 +1,32 @@
+import json
+import sys
+
+import pytest
+
+import puller
+import sidecar_reader
+from conftest import add_session
+
+
+def _read(monkeypatch, capsys, *argv) -> list[dict]:
+    monkeypatch.setattr(sys, "argv", ["sidecar_reader.py", *argv])
+    sidecar_reader.main()
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_rebuilds_blobbed_delta_bodies(fake_redis, redis_config, monkeypatch, capsys):
+    config = redis_config(REQUEST_BODY_MODE="delta", BLOB_MIN_BYTES=40)
+    add_session(fake_redis, "a", 3)
+    puller.run_once(config)
+    sidecar = str(puller.build_session_file_path(config["sidecar_dir"], "a"))
+
+    bodies = _read(monkeypatch, capsys, sidecar, "--blob-dir", config["blob_dir"])
+    assert [entry["requestSequence"] for entry in bodies] == [1, 2, 3]
+    for entry in bodies:
+        seq = entry["requestSequence"]
+        assert entry["body"] == json.loads(fake_redis.get(f"session:a:req:{seq}:requestBody"))
+
+    with pytest.raises(SystemExit) as excinfo:
+        _read(monkeypatch, capsys, sidecar)
+    assert excinfo.value.code == 2
+    assert "--blob-dir" in capsys.readouterr().err
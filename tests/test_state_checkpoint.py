@@ -0,0 +1,37 @@
+import pytest
+
+import puller
+from conftest import add_session
+
+
+@pytest.mark.parametrize("backend", ["json", "journal", "sqlite"])
+def test_shutdown_mid_poll_saves_finished_sessions(fake_redis, redis_config, monkeypatch, backend):
+    config = redis_config(STATE_BACKEND=backend)
+    add_session(fake_redis, "a", 2)
+    add_session(fake_redis, "b", 2)
+    puller.run_once(config)
+    add_session(fake_redis, "a", 2, start=3)
+    add_session(fake_redis, "b", 2, start=3)
+
+    process_session = puller.process_session
+    finished = []
+
+    def interrupted(r, state, session_id, *args, **kwargs):
+        if finished:
+            raise SystemExit(0)
+        process_session(r, state, session_id, *args, **kwargs)
+        finished.append(session_id)
+
+    monkeypatch.setattr(puller, "process_session", interrupted)
+    monkeypatch.setattr(puller.signal, "signal", lambda *args: None)
+    with pytest.raises(SystemExit):
+        puller.run_forever(config)
+
+    store = puller._open_state_store(config)
+    try:
+        sessions = store.load()["sessions"]
+    finally:
+        store.close()
+    assert finished and sessions[finished[0]]["cursor_seq"] == 4
+    unfinished = ({"a", "b"} - set(finished)).pop()
+    assert sessions[unfinished]["cursor_seq"] == 2
@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+
+import puller
+from conftest import add_session
+
+
+def _write_state(config: dict, sessions: dict) -> None:
+    path = Path(config["state_path"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"version": 1, "sessions": sessions}), encoding="utf-8")
+
+
+def _sessions(config: dict) -> dict:
+    return json.loads(Path(config["state_path"]).read_text(encoding="utf-8"))["sessions"]
+
+
+def test_state_gc_is_off_by_default(fake_redis, redis_config):
+    add_session(fake_redis, "live", 1)
+    config = redis_config()
+    _write_state(config, {"gone": {"cursor_seq": 9, "last_seen_at": 0}})
+    puller.run_once(config)
+    assert set(_sessions(config)) == {"gone", "live"}
+    assert _sessions(config)["gone"]["cursor_seq"] == 9
+
+
+def test_state_gc_drops_long_absent_sessions_when_enabled(fake_redis, redis_config):
+    add_session(fake_redis, "live", 1)
+    config = redis_config(STATE_GC_GRACE_SECONDS=3600)
+    _write_state(config, {"gone": {"cursor_seq": 9, "last_seen_at": 0}})
+    puller.run_once(config)
+    assert set(_sessions(config)) == {"live"}
@@ -0,0 +1,39 @@
+import json
+import re
+import shutil
+from pathlib import Path
+
+import puller
+from conftest import add_session
+
+
+BASELINE_STATE = Path(__file__).parent / "fixtures" / "baseline_state.json"
+
+
+def _sidecar_types(config: dict) -> list[str]:
+    path = puller.build_session_file_path(config["sidecar_dir"], "a")
+    if not path.exists():
+        return []
+    return [json.loads(line)["type"] for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_baseline_state_upgrades_without_re_emitting(fake_redis, redis_config):
+    # baseline_state.json was written by the exporter that stored session
+    # snapshots as sorted json.dumps text, for this exact Redis data.
+    add_session(fake_redis, "a", 2)
+    fake_redis.hset("session:a:info", mapping={"userName": "zoë", "note": '日本語 "q"'})
+    config = redis_config()
+    Path(config["state_path"]).parent.mkdir(parents=True)
+    shutil.copyfile(BASELINE_STATE, config["state_path"])
+
+    puller.run_once(config)
+
+    assert _sidecar_types(config) == []
+    assert not puller.build_session_file_path(config["dest_dir"], "a").exists()
+    entry = json.loads(Path(config["state_path"]).read_text(encoding="utf-8"))["sessions"]["a"]
+    for key in puller.SNAPSHOT_KEYS:
+        assert re.fullmatch(r"[0-9a-f]{32}", entry[key])
+
+    fake_redis.hset("session:a:usage", "outputTokens", "4")
+    puller.run_once(config)
+    assert _sidecar_types(config) == ["session_usage"]
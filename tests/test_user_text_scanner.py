@@ -0,0 +1,71 @@
+"""The linear User:/Assistant: scanner against the regex it replaced."""
+
+import random
+import re
+import time
+
+import pytest
+
+from session_events import extract_user_lines_from_conversation_text, should_ignore_user_text
+
+
+USER_BLOCK_RE = re.compile(
+    r"(?:^|\r?\n)User:\s*\r?\n([\s\S]*?)(?=(?:\r?\nAssistant:|\r?\nUser:|\s*$))"
+)
+IGNORED_PREFIXES = (
+    "# AGENTS.md instructions",
+    "<environment_context>",
+    "# System Instructions",
+    "# Conversation",
+)
+TOKENS = [
+    "User:", "Assistant:", "\n", "\r", "\r\n", " ", "\t", "x", "hello", "\x85", " ",
+    "\x1c", "\xa0", "User", "ser:", "\n\n", "# Conversation", "<environment_context>",
+]
+
+
+def regex_user_lines(text: str) -> list[str]:
+    blocks = ((match.group(1) or "").strip() for match in USER_BLOCK_RE.finditer(text))
+    return [block for block in blocks if block]
+
+
+def regex_should_ignore(text: str) -> bool:
+    stripped = text.strip()
+    return not stripped or stripped.startswith(IGNORED_PREFIXES)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "User:\nhello",
+        "User:\r\nhello\r\nAssistant:\r\nhi",
+        "User:  \n\n  first  \nUser:\nsecond\nAssistant:\nanswer\nUser:\n  \n",
+        "prefix User:\nnot a header\nUser:\nreal",
+        "User:\nx\nUser:\nUser:\ny",
+        "User:\n# Conversation\nkept anyway",
+        "User:\n line\x85sep\xa0",
+        "Assistant:\nUser:\nafter assistant",
+        "User:\nx" + " " * 5000 + "y",
+    ],
+)
+def test_matches_regex_on_edge_cases(text):
+    assert extract_user_lines_from_conversation_text(text) == regex_user_lines(text)
+    assert should_ignore_user_text(text) == regex_should_ignore(text)
+
+
+def test_matches_regex_on_random_transcripts():
+    rng = random.Random(24)
+    for _ in range(20000):
+        text = "".join(rng.choice(TOKENS) for _ in range(rng.randrange(0, 25)))
+        assert extract_user_lines_from_conversation_text(text) == regex_user_lines(text), repr(text)
+        assert should_ignore_user_text(text) == regex_should_ignore(text), repr(text)
+
+
+def test_long_whitespace_runs_stay_linear():
+    # The regex re-scans the run from every position (quadratic); 200K spaces
+    # take minutes there.
+    text = "User:\nx" + " " * 200_000 + "y\n" + "\t" * 200_000
+    started = time.perf_counter()
+    assert extract_user_lines_from_conversation_text(text) == ["x" + " " * 200_000 + "y"]
+    assert time.perf_counter() - started < 1.0